@@ -0,0 +1,108 @@
+"""
+Cache of annotation results for repeated documents.
+
+Documents are keyed by a hash of their tokens and of the linker settings, thus documents that differ only in case,
+punctuation or spacing share their annotations. Candidate entities are also cached per mention set (the mentions
+found in a document, in n-gram order), so that documents with the same mentions share their candidates. Both are
+kept in LRU caches of bounded size.
+
+Annotation results can also be stored in an sqlite database, which persists them across runs and is shared by
+processes. The database is tied to the fingerprint of the statistics the linker has loaded; it is cleared when they
+change.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+
+from nordlys.config import ANNOTATION_CACHE_SIZE
+from nordlys.lru_cache import LRUCache
+
+
+class AnnotationCache(object):
+
+    def __init__(self, fingerprint, max_size=ANNOTATION_CACHE_SIZE, db_file=None):
+        """
+        :param fingerprint: fingerprint of the statistics files (see IndexUtils.fingerprint())
+        :param max_size: max number of documents (and of mention sets) kept in memory
+        :param db_file: sqlite database annotation results are stored in, optional
+        """
+        self.fingerprint = json.dumps(fingerprint, sort_keys=True)
+        self.documents = LRUCache(max_size)
+        self.mention_sets = LRUCache(max_size)
+        self.db_file = db_file
+        self.db_hits = 0
+        self.__db = None
+        self.__pid = None
+
+    @staticmethod
+    def get_doc_key(tokens, settings):
+        """Returns the cache key of a document.
+
+        :param tokens: tokens of the document (see Document.get_tokens())
+        :param settings: settings of the linker the results depend on (tuple)
+        """
+        return hashlib.sha1(repr(settings) + "\n" + " ".join(tokens)).hexdigest()
+
+    @staticmethod
+    def get_mention_set_key(spans, settings):
+        """Returns the cache key of a mention set.
+
+        :param spans: spans of the mentions, in n-gram order
+        :param settings: settings of the linker the candidates depend on (tuple)
+        """
+        return settings + tuple(span.mention_id for span in spans)
+
+    def get(self, doc_key):
+        """Returns the cached annotations of a document {men:(en, score), ...}, or None.
+        The returned dictionary is shared by all hits and must not be modified.
+        """
+        linked_ens = self.documents.get(doc_key)
+        if linked_ens is None and self.db_file is not None:
+            row = self.__get_db().execute("SELECT value FROM annotations WHERE key = ?", (doc_key,)).fetchone()
+            if row is not None:
+                self.db_hits += 1
+                linked_ens = {}
+                for men, en, score in json.loads(row[0]):
+                    linked_ens[men.encode("utf-8")] = (en.encode("utf-8"), score)
+                self.documents.put(doc_key, linked_ens)
+        return linked_ens
+
+    def put(self, doc_key, linked_ens, mentions):
+        """Caches the annotations of a document.
+
+        :param linked_ens: annotations {men:(en, score), ...}
+        :param mentions: all mentions of the document, in the order the annotations were added (so that the same
+            dictionary is rebuilt when they are loaded from the database)
+        """
+        self.documents.put(doc_key, linked_ens)
+        if self.db_file is not None:
+            value = json.dumps([(men,) + linked_ens[men] for men in mentions if men in linked_ens])
+            db = self.__get_db()
+            db.execute("INSERT OR REPLACE INTO annotations VALUES (?, ?)", (doc_key, value))
+            db.commit()
+
+    def get_candidates(self, mention_set_key):
+        """Returns the cached candidates of a mention set (Candidates), or None."""
+        return self.mention_sets.get(mention_set_key)
+
+    def put_candidates(self, mention_set_key, candidates):
+        self.mention_sets.put(mention_set_key, candidates)
+
+    def __get_db(self):
+        """Returns the database connection of the current process (connections are not shared by forked processes).
+        The database is cleared if it was written with other statistics."""
+        if self.__db is None or self.__pid != os.getpid():
+            self.__db = sqlite3.connect(self.db_file, timeout=60)
+            self.__pid = os.getpid()
+            # the cache can be rebuilt, thus it is not synced to disk on every write
+            self.__db.execute("PRAGMA synchronous = OFF")
+            self.__db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.__db.execute("CREATE TABLE IF NOT EXISTS annotations (key TEXT PRIMARY KEY, value TEXT)")
+            row = self.__db.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+            if row is None or row[0] != self.fingerprint:
+                self.__db.execute("DELETE FROM annotations")
+                self.__db.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (self.fingerprint,))
+            self.__db.commit()
+        return self.__db
@@ -0,0 +1,221 @@
+"""
+Batch entity linking of a document file using a pool of processes.
+
+The input file has one `docID<TAB>text` document per line (see data/snippets.txt). Documents are sharded into
+chunks that are annotated by worker processes. The linker is created once in the parent process and the workers
+are forked from it, thus they inherit the loaded statistics (which are memory-mapped and shared via the page
+cache) instead of reloading them. The results are written in the same format as by the linkers' main() functions.
+
+By default, the results are written in docID order. In streaming mode (-s), documents are read lazily and the
+results are written incrementally in input order; memory use is then bounded by the number of chunks in flight,
+regardless of the corpus size. Input and output files may be "-" (stdin and stdout), so that the linkers can be
+used in Unix pipes.
+
+With -o, the character offsets of the mentions are added to the results as a last column. Overlapping mentions can
+be resolved before disambiguation (--resolve); see nordlys.spotter.
+
+Annotations of repeated documents are cached (see nordlys.annotation_cache); with --cache-file, they are also
+stored in a database that is shared by the workers and reused by later runs.
+
+Each chunk is annotated as a batch. With --pairs-working-set, TAGME reads the entity pairs table lazily: for each
+chunk, only the rows of its candidate entities are read from disk, and at most the given number of entity pairs is
+held in memory by each worker (see nordlys.inlinks_store). TAGME's relatedness cache is disabled by default
+(--relatedness-cache-size); with --relatedness-cache, it is loaded from a file (if it exists) and saved to it at the
+end of the run, including the scores computed by the workers, so that later runs start warm.
+
+Linking can be traced to a file of JSON events (-t); see nordlys.tracing. With -r, the time spent in each phase of
+the linking pipeline and the amount of work done are aggregated over all documents (and processes) and reported
+to stderr at the end of the run.
+
+Usage: python -m nordlys.batch [-s] [-r] [-p num_processes] [-t trace_file] <cmn|tagme> <input_file|-> <output_file|->
+"""
+
+import argparse
+from collections import deque
+from itertools import islice
+import multiprocessing
+import sys
+
+from nordlys.config import MIN_COMMONNESS, MAX_CANDIDATES, MIN_LINK_COUNT, MENTION_RESOLUTION, PAIRS_WORKING_SET_SIZE, \
+    RELATEDNESS_CACHE_SIZE
+from nordlys.document import Document
+from nordlys.el_cmn_sol import ELCmn
+from nordlys.el_tagme_sol import ELTagme
+from nordlys.el_utils import ELUtils
+from nordlys.spotter import MentionSpotter
+from nordlys.tracing import JsonlTracer, Profiler
+
+LINKERS = {"cmn": ELCmn, "tagme": ELTagme}
+
+# The linker used by the workers (and whether offsets are written); they are set before the pool is created so
+# that forked workers inherit them
+_linker = None
+_offsets = False
+
+
+def annotate_chunk(chunk):
+    """Annotates a chunk of documents [(doc_id, doc), ...].
+
+    :return: the results in the output format, the profile summary of the chunk (if the linker is profiled), and
+        the relatedness scores computed for the chunk (if they are tracked, see init_worker())
+    """
+    if _offsets:
+        out = [ELUtils.format_annotations(doc_id, *_linker.annotate_with_offsets(doc, doc_id)) for doc_id, doc in chunk]
+    else:
+        # the chunk is annotated as a batch, so that the linker fetches the statistics it needs once for the chunk
+        out = [ELUtils.format_annotations(doc_id, linked_ens)
+               for (doc_id, _), linked_ens in zip(chunk, _linker.annotate_batch(chunk))]
+    summary = _linker.tracer.get_summary(reset=True) if isinstance(_linker.tracer, Profiler) else None
+    relatedness = _linker.relatedness_cache.pop_new_entries() if hasattr(_linker, "relatedness_cache") else None
+    return "".join(out), summary, relatedness
+
+
+def init_worker(track_relatedness):
+    """Initializes a worker process.
+
+    :param track_relatedness: if True, the relatedness scores computed by the worker are passed to the parent
+        process, which merges them into its relatedness cache (so that it can be saved)
+    """
+    if track_relatedness:
+        _linker.relatedness_cache.track_new_entries()
+
+
+class BatchAnnotator(object):
+
+    def __init__(self, linker, num_processes=None, chunk_size=100, offsets=False):
+        """
+        :param linker: entity linker (ELCmn or ELTagme instance)
+        :param num_processes: number of worker processes (defaults to the number of CPUs)
+        :param chunk_size: number of documents sent to a worker at once
+        :param offsets: if True, the token offsets of the mentions are written
+        """
+        self.linker = linker
+        self.offsets = offsets
+        self.num_processes = num_processes or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.num_docs = 0
+        self.profiler = Profiler()  # aggregated profile of all chunks (if the linker is profiled)
+
+    def get_chunks(self, docs):
+        """Splits an iterable of documents [(doc_id, doc), ...] into chunks."""
+        docs = iter(docs)
+        while True:
+            chunk = list(islice(docs, self.chunk_size))
+            if len(chunk) == 0:
+                return
+            self.num_docs += len(chunk)
+            yield chunk
+
+    def __write(self, result, out_file):
+        """Writes the results of a chunk and merges its profile summary (and relatedness scores)."""
+        out, summary, relatedness = result
+        out_file.write(out)
+        if summary is not None:
+            self.profiler.merge(summary)
+        for key, rel in relatedness or []:
+            self.linker.relatedness_cache.put(key, rel)
+
+    def __run(self, docs, out_file):
+        """Annotates documents and writes the results to out_file, in the order of the documents.
+        At most 2 chunks per worker are in flight at any time.
+
+        :return: number of documents annotated
+        """
+        global _linker, _offsets
+        _linker = self.linker
+        _offsets = self.offsets
+        self.num_docs = 0
+        self.profiler = Profiler()
+        chunks = self.get_chunks(docs)
+
+        if self.num_processes == 1:
+            for chunk in chunks:
+                self.__write(annotate_chunk(chunk), out_file)
+            return self.num_docs
+
+        # the relatedness cache of the linker is only filled by the workers, thus it is merged if it is to be saved
+        track_relatedness = getattr(self.linker, "relatedness_cache_file", None) is not None
+        pool = multiprocessing.Pool(self.num_processes, init_worker, (track_relatedness,))
+        try:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(annotate_chunk, (chunk,)))
+                if len(pending) >= 2 * self.num_processes:
+                    self.__write(pending.popleft().get(), out_file)
+            while pending:
+                self.__write(pending.popleft().get(), out_file)
+        finally:
+            pool.close()
+            pool.join()
+        return self.num_docs
+
+    def annotate_file(self, input_file, output_file):
+        """Annotates all documents of the input file and writes the results in docID order to the output file.
+
+        :return: number of documents annotated
+        """
+        snippets = Document.load_test_snippets(input_file)
+        docs = sorted(snippets.items(), key=lambda item: int(item[0]))
+        with open(output_file, "w") as out_file:
+            return self.__run(docs, out_file)
+
+    def annotate_stream(self, in_file, out_file):
+        """Annotates the documents read lazily from a file object and writes the results incrementally (in input
+        order) to another file object.
+
+        :return: number of documents annotated
+        """
+        return self.__run(Document.read_snippets(in_file), out_file)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Batch entity linking")
+    parser.add_argument("method", choices=sorted(LINKERS.keys()), help="entity linking method")
+    parser.add_argument("input_file", help="documents file (docID<TAB>text), - for stdin (streaming mode only)")
+    parser.add_argument("output_file", help="output file, - for stdout (streaming mode only)")
+    parser.add_argument("-p", "--processes", type=int, default=None, help="number of processes (default: #CPUs)")
+    parser.add_argument("-s", "--stream", action="store_true", help="streaming mode (results in input order)")
+    parser.add_argument("-t", "--trace", default=None, help="file tracing events are written to (JSON lines)")
+    parser.add_argument("-r", "--profile", action="store_true", help="report per-phase timings and work counts")
+    parser.add_argument("--min-cmn", type=float, default=MIN_COMMONNESS, help="min commonness of candidates")
+    parser.add_argument("--max-cands", type=int, default=MAX_CANDIDATES, help="max candidates per mention")
+    parser.add_argument("--min-links", type=int, default=MIN_LINK_COUNT, help="min link count of mentions")
+    parser.add_argument("--resolve", choices=[MentionSpotter.LONGEST, MentionSpotter.LINKS], default=MENTION_RESOLUTION,
+                        help="overlapping mention resolution strategy (default: all mentions are used)")
+    parser.add_argument("-o", "--offsets", action="store_true", help="write the character offsets of the mentions")
+    parser.add_argument("--cache-file", default=None, help="sqlite database annotations are cached in")
+    parser.add_argument("--pairs-working-set", type=int, default=PAIRS_WORKING_SET_SIZE,
+                        help="read the entity pairs table lazily, keeping at most this many pairs in memory (tagme)")
+    parser.add_argument("--relatedness-cache", default=None,
+                        help="file the relatedness cache is loaded from and saved to at the end of the run (tagme)")
+    parser.add_argument("--relatedness-cache-size", type=int, default=RELATEDNESS_CACHE_SIZE,
+                        help="max number of entity pairs in the relatedness cache (tagme, default: 0, disabled)")
+    args = parser.parse_args(args)
+    if args.relatedness_cache is not None and args.relatedness_cache_size <= 0:
+        parser.error("--relatedness-cache needs a relatedness cache (--relatedness-cache-size)")
+
+    tracer = JsonlTracer(args.trace) if args.trace else None
+    if args.profile:
+        tracer = Profiler(tracer)
+    options = {"pairs_working_set_size": args.pairs_working_set, "relatedness_cache_file": args.relatedness_cache,
+               "relatedness_cache_size": args.relatedness_cache_size} if args.method == "tagme" else {}
+    linker = LINKERS[args.method](min_commonness=args.min_cmn, max_candidates=args.max_cands,
+                                  min_link_count=args.min_links, mention_resolution=args.resolve,
+                                  annotation_cache_file=args.cache_file, tracer=tracer, **options)
+    annotator = BatchAnnotator(linker, args.processes, offsets=args.offsets)
+    if not args.stream:
+        num_docs = annotator.annotate_file(args.input_file, args.output_file)
+    else:
+        in_file = sys.stdin if args.input_file == "-" else open(args.input_file, "r")
+        out_file = sys.stdout if args.output_file == "-" else open(args.output_file, "w")
+        num_docs = annotator.annotate_stream(in_file, out_file)
+        out_file.flush()
+    sys.stderr.write(str(num_docs) + " documents annotated\n")
+    if args.relatedness_cache is not None and args.method == "tagme":
+        linker.save_relatedness_cache()
+    if args.profile:
+        sys.stderr.write(annotator.profiler.report() + "\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,341 @@
+"""
+Benchmark of the entity linkers on synthetic data.
+
+A synthetic knowledge base (mention-entity, entity inlinks and entity pairs statistics) and a document corpus of
+configurable size are generated from a random seed, thus runs with the same configuration are reproducible.
+The statistics are compiled into indices, then each linker annotates the corpus in a fresh Python process,
+which reports:
+  - startup_time: seconds from launching the process until the linker is ready (imports, opening the indices)
+  - peak_memory_mb: peak resident memory of the process
+  - docs_per_sec, and the per-document latency percentiles (in ms)
+
+The results are written as JSON. If a baseline results file is given, the runs are compared against it and the
+metrics that got worse by more than the tolerance are reported as regressions (with a non-zero exit status).
+
+The tokenizer micro-benchmark (--tokenizer) measures the throughput (MB/s) of tokenizing a large text made of the
+sample snippets, with and without computing the character offsets of the tokens, against Document.preprocess().
+
+Usage: python -m nordlys.benchmark [-o results_file] [-b baseline_file] [--dir data_dir] [size options]
+       python -m nordlys.benchmark --tokenizer size_mb
+"""
+
+from __future__ import division
+import argparse
+from collections import OrderedDict
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy
+
+from nordlys.cmn_index import CmnIndex, load_cmn_index
+from nordlys.config import SNIPPETS
+from nordlys.document import Document
+from nordlys.el_cmn_sol import ELCmn
+from nordlys.el_tagme_sol import ELTagme
+from nordlys.entity_vocab import EntityVocab
+from nordlys.inlinks_store import InlinksStore, load_inlinks_store
+
+DEFAULT_CONFIG = OrderedDict([
+    ("mentions", 20000),  # number of distinct mentions
+    ("entities", 20000),  # number of distinct entities
+    ("candidates", 5),  # average number of candidate entities per mention
+    ("pair_density", 20),  # average number of entities an entity shares inlinks with
+    ("docs", 500),  # number of documents
+    ("doc_length", 30),  # number of tokens per document
+    ("mention_rate", 0.3),  # probability that a known mention is inserted at a given position of a document
+    ("seed", 0),
+])
+
+METHODS = ["cmn", "tagme"]
+
+# metrics compared against the baseline, and whether higher values are better
+METRICS = [("startup_time", False), ("peak_memory_mb", False), ("docs_per_sec", True),
+           ("latency_p50", False), ("latency_p90", False), ("latency_p99", False)]
+
+
+class SyntheticData(object):
+    """Synthetic statistics files and documents, stored in a data directory."""
+
+    def __init__(self, data_dir, config):
+        """
+        :param data_dir: directory of the generated files
+        :param config: data size settings (see DEFAULT_CONFIG)
+        """
+        self.data_dir = data_dir
+        self.config = config
+        self.mention_entity_file = data_dir + "/mention_entity.tsv"
+        self.inlinks_file = data_dir + "/entity_inlinks.tsv"
+        self.pairs_file = data_dir + "/entity_pairs_inlinks.tsv"
+        self.docs_file = data_dir + "/snippets.txt"
+        self.vocab_dir = data_dir + "/index/entities"
+        self.cmn_index_dir = data_dir + "/index/commonness"
+        self.inlinks_index_dir = data_dir + "/index/inlinks"
+
+    def exists(self):
+        """Checks whether the data has already been generated with the same configuration."""
+        config_file = self.data_dir + "/config.json"
+        if not os.path.exists(config_file):
+            return False
+        with open(config_file, "r") as f:
+            return json.load(f) == self.config
+
+    def generate(self):
+        """Generates the statistics files and the documents."""
+        rnd = random.Random(self.config["seed"])
+        num_entities = self.config["entities"]
+        entities = ["<wikipedia:Entity_" + str(i) + ">" for i in range(num_entities)]
+        # heavy-tailed number of inlinks, as in Wikipedia
+        inlinks = [min(int(5 * rnd.paretovariate(1.0)), 1000000) for _ in range(num_entities)]
+        words = ["w" + str(i) for i in range(max(self.config["mentions"] // 2, 100))]
+
+        # mentions of 1-3 tokens, made of (Zipf-like distributed) frequent words
+        mentions, seen = [], set()
+        while len(mentions) < self.config["mentions"]:
+            length = rnd.choice([1, 2, 2, 3])
+            mention = " ".join(words[int(len(words) * rnd.random() ** 2)] for _ in range(length))
+            if mention not in seen:
+                seen.add(mention)
+                mentions.append(mention)
+
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+        with open(self.mention_entity_file, "w") as f:
+            for mention in mentions:
+                num_cands = min(rnd.randint(1, 2 * self.config["candidates"] - 1), num_entities)
+                freqs = [rnd.randint(1, 100) for _ in range(num_cands)]
+                for e, freq in zip(rnd.sample(xrange(num_entities), num_cands), freqs):
+                    f.write(mention + "\t" + entities[e] + "\t" + str(freq) + "\n")
+                f.write(mention + "\t_total\t" + str(sum(freqs) + rnd.randint(0, sum(freqs))) + "\n")
+
+        with open(self.inlinks_file, "w") as f:
+            for e in range(num_entities):
+                f.write(entities[e] + "\t" + str(inlinks[e]) + "\n")
+
+        with open(self.pairs_file, "w") as f:
+            pairs = set()
+            for _ in range(int(num_entities * self.config["pair_density"] / 2)):
+                e1, e2 = rnd.randrange(num_entities), rnd.randrange(num_entities)
+                if e1 == e2 or (e1, e2) in pairs or (e2, e1) in pairs:
+                    continue
+                pairs.add((e1, e2))
+                common = rnd.randint(1, min(inlinks[e1], inlinks[e2]))
+                f.write(entities[e1] + "\t" + entities[e2] + "\t" + str(common) + "\n")
+
+        with open(self.docs_file, "w") as f:
+            for doc_id in range(1, self.config["docs"] + 1):
+                tokens = []
+                while len(tokens) < self.config["doc_length"]:
+                    if rnd.random() < self.config["mention_rate"]:
+                        tokens += mentions[rnd.randrange(len(mentions))].split()
+                    else:
+                        tokens.append(words[rnd.randrange(len(words))])
+                f.write(str(doc_id) + "\t" + " ".join(tokens[:self.config["doc_length"]]) + "\n")
+
+        with open(self.data_dir + "/config.json", "w") as f:
+            json.dump(self.config, f)
+
+    def build_indices(self):
+        """Compiles the statistics into indices.
+
+        :return: build time of each index (in seconds)
+        """
+        build_times = OrderedDict()
+        start = time.time()
+        EntityVocab.build(self.mention_entity_file, self.vocab_dir)
+        build_times["vocabulary"] = time.time() - start
+        vocab = EntityVocab(self.vocab_dir)
+        start = time.time()
+        CmnIndex.build(self.mention_entity_file, self.cmn_index_dir, vocab)
+        build_times["commonness"] = time.time() - start
+        start = time.time()
+        InlinksStore.build(self.inlinks_file, self.pairs_file, self.inlinks_index_dir, vocab)
+        build_times["inlinks"] = time.time() - start
+        return build_times
+
+
+def get_linker(method, data):
+    """Creates a linker using the indices of the synthetic data."""
+    cmn_index = load_cmn_index(data.mention_entity_file, data.cmn_index_dir, data.vocab_dir)
+    if method == "cmn":
+        return ELCmn(cmn_index)
+    inlinks_store = load_inlinks_store(data.inlinks_file, data.pairs_file, data.inlinks_index_dir,
+                                       data.mention_entity_file, data.vocab_dir)
+    return ELTagme(cmn_index, inlinks_store)
+
+
+def run_linker(method, data):
+    """Annotates the synthetic documents with a linker (in the current process) and measures its performance.
+    The returned "ready" timestamp is used by the parent process to compute the startup time.
+    """
+    load_start = time.time()
+    linker = get_linker(method, data)
+    ready = time.time()
+    with open(data.docs_file, "r") as f:
+        docs = list(Document.read_snippets(f))
+
+    latencies = []
+    start = time.time()
+    for doc_id, doc in docs:
+        doc_start = time.time()
+        linker.annotate(doc, doc_id)
+        latencies.append(time.time() - doc_start)
+    total_time = time.time() - start
+
+    # ru_maxrss is in kilobytes on Linux (bytes on Mac OS)
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_memory /= 1024
+    latencies_ms = 1000 * numpy.array(latencies)
+    return OrderedDict([
+        ("ready", ready),
+        ("load_time", ready - load_start),
+        ("peak_memory_mb", peak_memory / 1024),
+        ("docs", len(docs)),
+        ("total_time", total_time),
+        ("docs_per_sec", len(docs) / total_time if total_time > 0 else 0),
+        ("latency_mean", float(latencies_ms.mean()) if len(docs) > 0 else 0),
+        ("latency_p50", float(numpy.percentile(latencies_ms, 50)) if len(docs) > 0 else 0),
+        ("latency_p90", float(numpy.percentile(latencies_ms, 90)) if len(docs) > 0 else 0),
+        ("latency_p99", float(numpy.percentile(latencies_ms, 99)) if len(docs) > 0 else 0),
+        ("latency_max", float(latencies_ms.max()) if len(docs) > 0 else 0),
+    ])
+
+
+def benchmark_linker(method, data, repeat=1):
+    """Runs a linker in fresh processes and returns the results of the fastest run.
+
+    :param repeat: number of runs
+    """
+    best = None
+    for _ in range(repeat):
+        launched = time.time()
+        out = subprocess.check_output([sys.executable, "-m", "nordlys.benchmark", "--run", method,
+                                       "--dir", data.data_dir])
+        result = json.loads(out, object_pairs_hook=OrderedDict)
+        result["startup_time"] = result.pop("ready") - launched
+        if best is None or result["docs_per_sec"] > best["docs_per_sec"]:
+            best = result
+    return best
+
+
+def benchmark_tokenizer(size_mb, docs_file=SNIPPETS):
+    """Measures the throughput of document tokenization (in MB/s) on size_mb MB of text.
+
+    :param docs_file: documents the text is made of (repeated as many times as needed)
+    """
+    with open(docs_file, "r") as f:
+        docs = [doc for _, doc in Document.read_snippets(f)]
+    size = sum(len(doc) for doc in docs)
+    docs *= max(int(size_mb * 1000000 / size), 1)
+    size_mb = sum(len(doc) for doc in docs) / 1000000
+
+    tokenizers = [("preprocess", lambda doc: Document.preprocess(doc).lower().split()),
+                  ("tokenize", Document.tokenize),
+                  ("tokenize_offsets", lambda doc: Document("", doc).get_offsets())]
+    results = OrderedDict([("size_mb", size_mb)])
+    for name, tokenizer in tokenizers:
+        start = time.time()
+        for doc in docs:
+            tokenizer(doc)
+        results[name + "_mb_per_sec"] = size_mb / (time.time() - start)
+    return results
+
+
+def compare(results, baseline, tolerance=0.1):
+    """Compares benchmark results against a baseline.
+
+    :param tolerance: relative change of a metric (in the bad direction) reported as regression
+    :return: report lines and the list of regressions [(method, metric), ...]
+    """
+    lines, regressions = [], []
+    if results["config"] != baseline["config"]:
+        lines += ["WARNING: the configuration of the baseline differs", ""]
+    lines.append("%-8s %-16s %12s %12s %9s" % ("Method", "Metric", "Baseline", "Current", "Change"))
+    for method in results["results"]:
+        if method not in baseline["results"]:
+            continue
+        for metric, higher_is_better in METRICS:
+            base_val = baseline["results"][method][metric]
+            val = results["results"][method][metric]
+            change = (val - base_val) / base_val if base_val else 0
+            regressed = change < -tolerance if higher_is_better else change > tolerance
+            if regressed:
+                regressions.append((method, metric))
+            lines.append("%-8s %-16s %12.3f %12.3f %+8.1f%%%s" % (method, metric, base_val, val, 100 * change,
+                                                                 "  REGRESSION" if regressed else ""))
+    return lines, regressions
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Entity linking benchmark on synthetic data")
+    for name, value in DEFAULT_CONFIG.iteritems():
+        parser.add_argument("--" + name.replace("_", "-"), type=type(value), default=value)
+    parser.add_argument("-m", "--methods", default=",".join(METHODS), help="linkers to benchmark (comma separated)")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="runs per linker (the fastest one is kept)")
+    parser.add_argument("-o", "--output", default=None, help="file the results are written to (JSON)")
+    parser.add_argument("-b", "--baseline", default=None, help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change reported as regression")
+    parser.add_argument("--dir", default=None, help="data directory (kept and reused if the config matches)")
+    parser.add_argument("--tokenizer", type=float, default=None, metavar="SIZE_MB",
+                        help="runs the tokenizer micro-benchmark on SIZE_MB MB of text")
+    parser.add_argument("--run", default=None, help=argparse.SUPPRESS)  # runs a single linker (internal)
+    args = parser.parse_args(args)
+
+    if args.tokenizer is not None:
+        print(json.dumps(benchmark_tokenizer(args.tokenizer), indent=2))
+        return
+
+    if args.run is not None:
+        with open(args.dir + "/config.json", "r") as f:
+            data = SyntheticData(args.dir, json.load(f, object_pairs_hook=OrderedDict))
+        print(json.dumps(run_linker(args.run, data)))
+        return
+
+    config = OrderedDict((name, getattr(args, name)) for name in DEFAULT_CONFIG)
+    data = SyntheticData(args.dir or tempfile.mkdtemp(prefix="nordlys_benchmark_"), config)
+    try:
+        if not data.exists():
+            sys.stderr.write("generating synthetic data in " + data.data_dir + " ...\n")
+            data.generate()
+        build_times = data.build_indices()
+
+        results = OrderedDict()
+        for method in args.methods.split(","):
+            sys.stderr.write("benchmarking " + method + " ...\n")
+            results[method] = benchmark_linker(method, data, args.repeat)
+    finally:
+        if args.dir is None:
+            shutil.rmtree(data.data_dir)
+
+    output = OrderedDict([
+        ("config", config),
+        ("environment", OrderedDict([("python", platform.python_version()), ("numpy", numpy.__version__),
+                                     ("platform", platform.platform())])),
+        ("index_build_time", build_times),
+        ("results", results),
+    ])
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f, object_pairs_hook=OrderedDict)
+        lines, regressions = compare(output, baseline, args.tolerance)
+        sys.stderr.write("\n".join(lines) + "\n")
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
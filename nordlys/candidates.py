@@ -0,0 +1,94 @@
+"""
+Compact representation of the candidate entities of a document.
+
+The candidates of all mentions are stored in flat arrays of entity IDs (see nordlys.entity_vocab) and commonness
+scores, instead of per-mention lists of entity URIs and dictionaries; the candidates of the i-th mention are at
+positions [ptr[i], ptr[i+1]). Candidates of a mention keep the order of the commonness index (decreasing
+commonness), thus the candidate with the highest commonness always comes first.
+
+Entity URIs are only decoded for the entities that are linked (or traced).
+"""
+
+from array import array
+
+import numpy
+
+
+class Candidates(object):
+    """Candidate entities of the mentions of a document."""
+
+    __slots__ = ["mentions", "mention_ids", "counts", "ptr", "entity_ids", "cmn", "cmn_index"]
+
+    def __init__(self, cmn_index, mentions, mention_ids, counts, ptr, entity_ids, cmn):
+        """
+        :param cmn_index: commonness index the entity IDs refer to
+        :param mentions: list of mentions
+        :param mention_ids: IDs of the mentions in the commonness index (array)
+        :param counts: number of occurrences of each mention in the document (array)
+        :param ptr: candidates of the i-th mention are at positions [ptr[i], ptr[i+1]) (array)
+        :param entity_ids: candidate entity IDs (numpy array)
+        :param cmn: commonness scores of the candidates (numpy array)
+        """
+        self.cmn_index = cmn_index
+        self.mentions = mentions
+        self.mention_ids = mention_ids
+        self.counts = counts
+        self.ptr = ptr
+        self.entity_ids = entity_ids
+        self.cmn = cmn
+
+    def __len__(self):
+        return len(self.mentions)
+
+    @staticmethod
+    def build(cmn_index, mention_cands, counts):
+        """Builds the candidates of a document.
+
+        :param cmn_index: commonness index
+        :param mention_cands: dictionary {men: (mention ID, entity IDs, commonness scores), ...} (see
+            CmnIndex.get_candidate_ids())
+        :param counts: number of occurrences of each mention {men: count, ...}
+        :return: Candidates
+        """
+        # mentions are taken in the iteration order of the dictionary, as with {men:[en1, ...], ...}
+        mentions = mention_cands.keys()
+        ptr = array("i", [0])
+        for m in mentions:
+            ptr.append(ptr[-1] + len(mention_cands[m][1]))
+        if len(mentions) == 0:
+            return Candidates(cmn_index, mentions, array("i"), array("i"), ptr, numpy.zeros(0, dtype=numpy.int32),
+                              numpy.zeros(0))
+        entity_ids = numpy.concatenate([mention_cands[m][1] for m in mentions])
+        cmn = numpy.concatenate([mention_cands[m][2] for m in mentions])
+        return Candidates(cmn_index, mentions, array("i", [mention_cands[m][0] for m in mentions]),
+                          array("i", [counts[m] for m in mentions]), ptr, entity_ids, cmn)
+
+    def get_range(self, i):
+        """Returns the positions [start, end) of the candidates of the i-th mention."""
+        return self.ptr[i], self.ptr[i + 1]
+
+    def get_entity(self, k):
+        """Returns the URI of the k-th candidate."""
+        return self.cmn_index.get_entity(int(self.entity_ids[k]))
+
+    def get_entities(self, i):
+        """Returns the URIs of the candidate entities of the i-th mention."""
+        return [self.cmn_index.get_entity(e) for e in self.entity_ids[self.ptr[i]:self.ptr[i + 1]].tolist()]
+
+    def get_dict_order(self, i):
+        """Returns the positions of the candidates of the i-th mention (relative to the first one) in the order ties
+        are broken by TAGME (see CmnIndex.get_dict_order())."""
+        return self.cmn_index.get_dict_order(self.mention_ids[i], self.ptr[i + 1] - self.ptr[i])
+
+    def get_mention_rows(self):
+        """Returns the mention index of each candidate (numpy array)."""
+        return numpy.repeat(numpy.arange(len(self.mentions)), numpy.diff(numpy.array(self.ptr)))
+
+    def num_candidates(self):
+        """Returns the number of candidate mention-entity pairs (counted for each occurrence of the mentions)."""
+        return sum(c * (self.ptr[i + 1] - self.ptr[i]) for i, c in enumerate(self.counts))
+
+    def to_dict(self):
+        """Returns the candidates as a dictionary {men:[en1, ...], ...}, with the entities of repeated mentions
+        listed once per occurrence."""
+        return {m: self.get_entities(i) * self.counts[i] for i, m in enumerate(self.mentions)}
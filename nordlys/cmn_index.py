@@ -0,0 +1,210 @@
+"""
+Compiled commonness index.
+
+The mention-entity statistics are compiled once into a set of flat binary files:
+
+  - mentions.bin, mention_offsets.npy: sorted mentions
+  - mention_ptr.npy: for mention i, its candidates are at positions [ptr[i], ptr[i+1])
+  - cand_entities.npy: candidate entity IDs (int32, see nordlys.entity_vocab), sorted by decreasing commonness for
+    each mention (see build())
+  - cand_cmn.npy: precomputed commonness scores (float64)
+  - cand_order.npy: position of each candidate in the iteration order of the commonness dictionary of the mention the
+    linkers used to hold (see build() and get_dict_order())
+  - mention_links.npy: number of times each mention is linked (the `_total` value, 0 if unknown)
+  - meta.json: source file fingerprint, used for detecting stale indices (see IndexUtils)
+
+The linkers open these files via mmap and query them lazily, thus the start-up cost does not depend on the
+size of the mention table and multiple processes share the same page-cached copy.
+
+Usage: python -m nordlys.cmn_index [mention_entity_file] [index_dir] [vocab_dir]
+"""
+from __future__ import division
+import csv
+import sys
+
+import numpy
+
+from nordlys.config import STATS_MENTION_ENTITY, CMN_INDEX_DIR, ENTITY_VOCAB_DIR
+from nordlys.entity_vocab import load_entity_vocab
+from nordlys.index_utils import IndexUtils, StringTable
+
+
+class CmnIndex(object):
+    """Read-only, memory-mapped commonness index."""
+
+    MEMO_SIZE = 4096  # max number of decoded mentions kept in memory
+    VERSION = 6  # format version
+
+    def __init__(self, index_dir=CMN_INDEX_DIR, vocab=None):
+        """
+        :param vocab: entity vocabulary the index was built with (EntityVocab; opened from the default location if
+            not provided)
+        """
+        self.index_dir = index_dir
+        self.vocab = vocab if vocab is not None else load_entity_vocab()
+        self.mentions = StringTable(index_dir + "/mentions.bin", index_dir + "/mention_offsets.npy")
+        self.__ptr = IndexUtils.load_array(index_dir + "/mention_ptr.npy")
+        self.__cand_entities = IndexUtils.load_array(index_dir + "/cand_entities.npy")
+        self.__cand_cmn = IndexUtils.load_array(index_dir + "/cand_cmn.npy")
+        self.__cand_order = IndexUtils.load_array(index_dir + "/cand_order.npy")
+        self.__links = IndexUtils.load_array(index_dir + "/mention_links.npy")
+        self.meta = IndexUtils.load_meta(index_dir)
+        self.__memo = {}
+
+    def __len__(self):
+        return len(self.mentions)
+
+    def __contains__(self, mention):
+        return self.mentions.index(mention) != -1
+
+    def __getitem__(self, mention):
+        cmn = self.get(mention)
+        if cmn is None:
+            raise KeyError(mention)
+        return cmn
+
+    def get(self, mention, default=None):
+        """Returns the commonness scores of a mention as a dictionary {en: cmn, ...}."""
+        cmn = self.__memo.get(mention)
+        if cmn is not None:
+            return cmn
+        candidates = self.lookup(mention)
+        if candidates is None:
+            return default
+        cmn = {self.vocab.get_entity(e): s for e, s in zip(candidates[0].tolist(), candidates[1].tolist())}
+        if len(self.__memo) >= self.MEMO_SIZE:
+            self.__memo.clear()
+        self.__memo[mention] = cmn
+        return cmn
+
+    def get_candidate_ids(self, mention_id, min_commonness=0, max_candidates=0):
+        """Returns the (pruned) candidates of a mention, given its ID (see get_mention_id()), as arrays of entity IDs
+        and commonness scores, by decreasing commonness. The arrays are views of the index; nothing is decoded.
+
+        :param min_commonness: candidates with lower commonness are discarded
+        :param max_candidates: max number of candidates, with the highest commonness (0: no limit)
+        """
+        start, end = int(self.__ptr[mention_id]), int(self.__ptr[mention_id + 1])
+        if max_candidates > 0:
+            end = min(end, start + max_candidates)
+        entity_ids, scores = self.__cand_entities[start:end], self.__cand_cmn[start:end]
+        if min_commonness > 0:
+            n = int(numpy.count_nonzero(scores >= min_commonness))
+            entity_ids, scores = entity_ids[:n], scores[:n]
+        return entity_ids, scores
+
+    def get_dict_order(self, mention_id, num_candidates):
+        """Returns the positions of the first num_candidates candidates of a mention, given its ID, in the iteration
+        order of a dictionary {en: score, ...} of these candidates filled in the order of the commonness dictionary
+        of the mention, as the score dictionaries TAGME used to select entities from (see ELTagme.select_top_k()).
+
+        :param num_candidates: number of (pruned) candidates, see get_candidate_ids()
+        :return: list of positions, among the candidates of the mention
+        """
+        start = int(self.__ptr[mention_id])
+        order = self.__cand_order[start:start + num_candidates]
+        scores = dict()
+        for k in numpy.argsort(order, kind="mergesort").tolist():
+            scores[self.vocab.get_entity(int(self.__cand_entities[start + k]))] = k
+        return scores.values()
+
+    def get_mention_links(self, mention_id):
+        """Returns the number of times a mention, given its ID, is linked to any entity."""
+        return int(self.__links[mention_id])
+
+    def get_mention_id(self, mention):
+        """Returns the ID of a mention (its position in the mention table), or -1 if it is unknown."""
+        return self.mentions.index(mention)
+
+    def lookup(self, mention):
+        """Returns the candidate entity IDs and their commonness scores for a mention (or None)."""
+        i = self.mentions.index(mention)
+        if i == -1:
+            return None
+        return self.get_candidate_ids(i)
+
+    def get_entity(self, entity_id):
+        """Returns the URI of an entity ID."""
+        return self.vocab.get_entity(entity_id)
+
+    def get_entity_id(self, entity):
+        """Returns the ID of an entity URI, or -1 if it is unknown."""
+        return self.vocab.get_entity_id(entity)
+
+    @staticmethod
+    def build(stats_file=STATS_MENTION_ENTITY, index_dir=CMN_INDEX_DIR, vocab=None):
+        """Compiles the mention-entity statistics file into an index.
+
+        :param vocab: entity vocabulary of the statistics file (EntityVocab); it is opened from the default
+            location (and built, if needed) if not provided
+        """
+        vocab = vocab if vocab is not None else load_entity_vocab(stats_file)
+        # load mention-entity stat; the entities of each mention are kept in a dictionary filled in file order, as the
+        # linkers' commonness dictionaries were (including `_total`), since it defines the order of ties
+        freqs = {}
+        with open(stats_file, 'rb') as tsvfile:
+            reader = csv.reader(tsvfile, delimiter='\t')
+            for row in reader:
+                mention, entity, freq = row[0], row[1], int(row[2])
+                if mention not in freqs:
+                    freqs[mention] = dict()
+                freqs[mention][entity] = freq
+
+        entity_ids = vocab.get_id_map()
+
+        # mentions without any linked entity are not stored
+        mentions = sorted(m for m, ens in freqs.iteritems() if len(ens) > ("_total" in ens))
+        ptr = numpy.zeros(len(mentions) + 1, dtype=numpy.int64)
+        links = numpy.zeros(len(mentions), dtype=numpy.int64)
+        cand_entities, cand_cmn, cand_order = [], [], []
+        for i, m in enumerate(mentions):
+            # compute commonness by normalizing with total value
+            norm = freqs[m].get("_total", 0)
+            links[i] = norm
+            candidates = [(entity_ids[e], freq / norm if norm != 0 else freq, r)
+                          for r, (e, freq) in enumerate(freqs[m].iteritems()) if e != "_total"]
+            # sorted by decreasing commonness; ties are kept in the iteration order of the dictionary, as the linkers
+            # used to break ties by selecting the first such entity
+            candidates.sort(key=lambda cand: -cand[1])
+            cand_entities += [e for e, _, _ in candidates]
+            cand_cmn += [cmn for _, cmn, _ in candidates]
+            cand_order += [r for _, _, r in candidates]
+            ptr[i + 1] = len(cand_entities)
+
+        tmp_dir = IndexUtils.create_tmp_dir(index_dir)
+        StringTable.write(mentions, tmp_dir + "/mentions.bin", tmp_dir + "/mention_offsets.npy")
+        numpy.save(tmp_dir + "/mention_ptr.npy", ptr)
+        numpy.save(tmp_dir + "/cand_entities.npy", numpy.array(cand_entities, dtype=numpy.int32))
+        numpy.save(tmp_dir + "/cand_cmn.npy", numpy.array(cand_cmn, dtype=numpy.float64))
+        numpy.save(tmp_dir + "/cand_order.npy", numpy.array(cand_order, dtype=numpy.int32))
+        numpy.save(tmp_dir + "/mention_links.npy", links)
+        IndexUtils.commit(tmp_dir, index_dir, [stats_file],
+                          {"mentions": len(mentions), "entities": len(vocab), "version": CmnIndex.VERSION})
+
+
+_loaded = {}
+
+
+def load_cmn_index(stats_file=STATS_MENTION_ENTITY, index_dir=CMN_INDEX_DIR, vocab_dir=ENTITY_VOCAB_DIR):
+    """Returns the commonness index, building it (and the entity vocabulary) first if it is missing or stale.
+    Indices are opened once per process and shared by all linkers.
+    """
+    if index_dir not in _loaded:
+        vocab = load_entity_vocab(stats_file, vocab_dir)
+        if IndexUtils.is_stale(index_dir, [stats_file], CmnIndex.VERSION):
+            CmnIndex.build(stats_file, index_dir, vocab)
+        _loaded[index_dir] = CmnIndex(index_dir, vocab)
+    return _loaded[index_dir]
+
+
+def main(args):
+    stats_file = args[0] if len(args) > 0 else STATS_MENTION_ENTITY
+    index_dir = args[1] if len(args) > 1 else CMN_INDEX_DIR
+    vocab_dir = args[2] if len(args) > 2 else ENTITY_VOCAB_DIR
+    print("building commonness index from " + stats_file + " ...")
+    CmnIndex.build(stats_file, index_dir, load_entity_vocab(stats_file, vocab_dir))
+    print("index written to " + index_dir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -16,4 +16,20 @@ STATS_ENTITY_PAIRS_INLINKS = DATA_DIR + "/entity_pairs_inlinks.tsv"
 
 SNIPPETS = DATA_DIR + "/snippets.txt"
 
-ENTITY_COUNT = 3051661  # total number of entities in the KB
\ No newline at end of file
+ENTITY_COUNT = 3051661  # total number of entities in the KB
+
+INDEX_DIR = DATA_DIR + "/index"
+ENTITY_VOCAB_DIR = INDEX_DIR + "/entities"
+CMN_INDEX_DIR = INDEX_DIR + "/commonness"
+INLINKS_INDEX_DIR = INDEX_DIR + "/inlinks"
+RELATEDNESS_CACHE_SIZE = 0  # max number of entity pairs in the relatedness cache (0: disabled)
+PAIRS_WORKING_SET_SIZE = 0  # max number of entity pairs held in memory if the pairs table is read lazily (0: mmap)
+ANNOTATION_CACHE_SIZE = 10000  # max number of documents (and mention sets) in the annotation cache
+
+# candidate pruning (disabled by default)
+MIN_COMMONNESS = 0  # candidate entities with lower commonness are discarded
+MAX_CANDIDATES = 0  # max number of candidate entities per mention, by commonness (0: no limit)
+MIN_LINK_COUNT = 0  # mentions linked fewer times (the `_total` value in the mention-entity stats) are ignored
+
+# overlapping mention resolution: None (all mentions are disambiguated), "longest" or "links" (see MentionSpotter)
+MENTION_RESOLUTION = None
@@ -5,13 +5,23 @@ Utility class for input documents.
 @author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
 """
 
+from array import array
 import re
 
+TOKEN_PATTERN = re.compile("[A-Za-z0-9]+")
+
 
 class Document(object):
     def __init__(self, doc_id, doc):
         self.id = doc_id
-        self.doc = self.preprocess(doc).lower()
+        self.text = doc
+        self.tokens = self.tokenize(doc)
+        self.__offsets = None
+
+    @property
+    def doc(self):
+        """The pre-processed (and lowercased) document."""
+        return " ".join(self.tokens)
 
     @staticmethod
     def preprocess(input_str):
@@ -22,6 +32,67 @@ class Document(object):
         cleaned_str = ' '.join(input_str.split())
         return cleaned_str
 
+    @staticmethod
+    def tokenize(input_str):
+        """Splits the document into lowercased tokens in a single pass.
+        The tokens are the same as those of the pre-processed document: preprocess(input_str).lower().split()
+
+        :return: list of tokens
+        """
+        # tokens are found in the original text and lowercased afterwards, as lowercasing may turn non-ASCII
+        # characters into token characters (e.g., u"\u212a", the Kelvin sign, into "k")
+        if "OR" not in input_str and "AND" not in input_str:
+            return " ".join(TOKEN_PATTERN.findall(input_str)).lower().split()
+        return [input_str[start:end].lower() for start, end in Document.get_token_spans(input_str)]
+
+    @staticmethod
+    def get_token_spans(input_str):
+        """Returns the character offsets [(start, end), ...] of the tokens of the document (see tokenize())."""
+        spans = [m.span() for m in TOKEN_PATTERN.finditer(input_str)]
+        # the " OR " and " AND " operators are removed in this order, as by preprocess()
+        if "OR" in input_str:
+            spans = Document.__remove_word(input_str, spans, "OR")
+        if "AND" in input_str:
+            spans = Document.__remove_word(input_str, spans, "AND")
+        return spans
+
+    @staticmethod
+    def __remove_word(input_str, spans, word):
+        """Removes the tokens equal to word, as input_str.replace(" " + word + " ", " ") would do after the
+        non-alphanumeric characters have been replaced by spaces. That is, a token is removed if it is both
+        preceded and followed by a space, unless the preceding space has been consumed by the removal of the
+        previous token.
+        """
+        n = len(spans)
+        space_before = n > 0 and spans[0][0] > 0
+        space_after = n > 0 and spans[-1][1] < len(input_str)
+        kept = []
+        for i, (start, end) in enumerate(spans):
+            if space_before and (i < n - 1 or space_after) and end - start == len(word) and \
+                    input_str[start:end] == word:
+                space_before = False
+                continue
+            space_before = True
+            kept.append((start, end))
+        return kept
+
+    def get_tokens(self):
+        """Returns the list of tokens of the (pre-processed) document."""
+        return self.tokens
+
+    def get_offsets(self):
+        """Returns the character offsets of the tokens in the original document, as arrays of start and end
+        (exclusive) offsets. They are computed on first use."""
+        if self.__offsets is None:
+            spans = self.get_token_spans(self.text)
+            self.__offsets = array("i", [start for start, _ in spans]), array("i", [end for _, end in spans])
+        return self.__offsets
+
+    def get_char_span(self, start, end):
+        """Returns the character offsets [start, end) in the original document of the tokens [start, end)."""
+        starts, ends = self.get_offsets()
+        return starts[start], ends[end - 1]
+
     def get_ngrams(self):
         """Finds all n-grams of the document.
 
@@ -37,12 +108,20 @@ class Document(object):
                 ngrams.append(ngram)
         return ngrams
 
+    @staticmethod
+    def read_snippets(in_file):
+        """Reads document snippets lazily from a file object, one `id<TAB>snippet` per line.
+
+        :return: generator of (id, snippet) pairs
+        """
+        for line in in_file:
+            if line.strip() == "":
+                continue
+            cols = line.strip().split("\t")
+            yield cols[0].strip(), cols[1].strip()
+
     @staticmethod
     def load_test_snippets(snippets_file):
         """Loads the test document snippets and resturns them as a dictionary {id : snippet}"""
-        docs = {}
-        q_file = open(snippets_file, "r")
-        for line in q_file:
-            cols = line.strip().split("\t")
-            docs[cols[0].strip()] = cols[1].strip()
-        return docs
\ No newline at end of file
+        with open(snippets_file, "r") as q_file:
+            return dict(Document.read_snippets(q_file))
\ No newline at end of file
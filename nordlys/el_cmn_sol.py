@@ -7,78 +7,221 @@ Entity linking using commonness.
 """
 from __future__ import division
 from collections import defaultdict
-import csv
 
-from nordlys.config import SNIPPETS, OUTPUT_DIR, STATS_MENTION_ENTITY
+from nordlys.annotation_cache import AnnotationCache
+from nordlys.candidates import Candidates
+from nordlys.cmn_index import load_cmn_index
+from nordlys.config import SNIPPETS, OUTPUT_DIR, MIN_COMMONNESS, MAX_CANDIDATES, MIN_LINK_COUNT, \
+    MENTION_RESOLUTION, ANNOTATION_CACHE_SIZE
 from nordlys.document import Document
 from nordlys.el_utils import ELUtils
+from nordlys.spotter import MentionSpotter
+from nordlys.tracing import DebugTracer, Profile
 
 
 class ELCmn(object):
 
-    def __init__(self):
-        self.commonness = dict()
-        self.get_commonness()
+    def __init__(self, cmn_index=None, min_commonness=MIN_COMMONNESS, max_candidates=MAX_CANDIDATES,
+                 min_link_count=MIN_LINK_COUNT, mention_resolution=MENTION_RESOLUTION,
+                 annotation_cache_size=ANNOTATION_CACHE_SIZE, annotation_cache_file=None, tracer=None):
+        """
+        :param cmn_index: commonness index (opened from the default location if not provided)
+        :param min_commonness: candidate entities with lower commonness are pruned
+        :param max_candidates: max number of candidate entities per mention, by commonness (0: no limit)
+        :param min_link_count: mentions linked fewer times are ignored
+        :param mention_resolution: strategy for selecting non-overlapping mentions (MentionSpotter.LONGEST or
+            MentionSpotter.LINKS); all mentions are used if None
+        :param annotation_cache_size: max number of documents in the annotation cache (0 disables it)
+        :param annotation_cache_file: sqlite database the annotation cache is persisted in, optional
+        :param tracer: receives tracing events (see nordlys.tracing); the linker is quiet if not provided
+        """
+        self.commonness = cmn_index
+        if self.commonness is None:
+            self.get_commonness()
+        self.spotter = MentionSpotter(self.commonness)
+        self.min_commonness = min_commonness
+        self.max_candidates = max_candidates
+        self.min_link_count = min_link_count
+        self.mention_resolution = mention_resolution
+        self.annotation_cache = None
+        if annotation_cache_size > 0 or annotation_cache_file is not None:
+            self.annotation_cache = AnnotationCache([self.commonness.meta["source"]], annotation_cache_size,
+                                                    annotation_cache_file)
+        self.tracer = tracer
 
     def get_commonness(self):
-        """Loads statistics and computes commonness."""
-        # load mention-entity stat
-        with open(STATS_MENTION_ENTITY, 'rb') as tsvfile:
-            reader = csv.reader(tsvfile, delimiter='\t')
-            for row in reader:
-                mention, entity, freq = row[0], row[1], int(row[2])
-                if mention not in self.commonness:
-                    self.commonness[mention] = dict()
-                self.commonness[mention][entity] = freq
-
-        # compute commonness by normalizing with total value
-        for m in self.commonness.keys():
-            for e in self.commonness[m].keys():
-                norm = self.commonness[m].get("_total", 0)
-                if e != "_total" and norm != 0:
-                    self.commonness[m][e] /= norm
+        """Opens the commonness index (it is compiled from the mention-entity stats on first use)."""
+        self.commonness = load_cmn_index()
 
     def annotate(self, doc, doc_id):
         """Performs entity linking and annotates the query."""
-        mention_ens = self.parse(doc, doc_id)
-        ELUtils.debug_mention_detection(mention_ens)
+        if self.tracer is not None:
+            return self.__annotate_traced(doc, doc_id)[0]
+        if self.annotation_cache is None:
+            return self.disambiguate(self.parse(doc, doc_id))
+        return self.__annotate_cached(Document(doc_id, doc))
 
-        disamb_ens = self.disambiguate(mention_ens)
-        ELUtils.debug_disambiguation(disamb_ens)
+    def annotate_with_offsets(self, doc, doc_id):
+        """Performs entity linking and returns the annotations along with the character offsets of their mentions
+        in the document.
 
+        :return: disambiguated entities {men:en, ...} and offsets {men: [(start, end), ...], ...}
+        """
+        if self.tracer is None:
+            query = Document(doc_id, doc)
+            spans = self.get_spans(query)
+            if self.annotation_cache is None:
+                disamb_ens = self.disambiguate(self.get_candidates(spans), doc_id)
+            else:
+                disamb_ens = self.__annotate_cached(query, spans)
+        else:
+            disamb_ens, spans, query = self.__annotate_traced(doc, doc_id)
+        return disamb_ens, MentionSpotter.get_offsets(spans, disamb_ens, query)
+
+    def __annotate_cached(self, query, spans=None):
+        """Same as annotate(), with the results looked up in (and added to) the annotation cache.
+
+        :param query: Document
+        :param spans: spans of the mentions in the document (they are found if not given)
+        :return: disambiguated entities {men:en, ...}
+        """
+        doc_key = AnnotationCache.get_doc_key(query.get_tokens(), self.get_settings())
+        disamb_ens = self.annotation_cache.get(doc_key)
+        if disamb_ens is None:
+            candidates = self.get_candidates(self.get_spans(query) if spans is None else spans)
+            disamb_ens = self.disambiguate(candidates, query.id)
+            self.annotation_cache.put(doc_key, disamb_ens, candidates.mentions)
         return disamb_ens
 
+    def __annotate_traced(self, doc, doc_id):
+        """Same as annotate(), with each phase timed and traced.
+
+        :return: disambiguated entities, the spans of the mentions and the document
+        """
+        profile = Profile(doc_id)
+        num_lookups = self.spotter.num_lookups
+        query = Document(doc_id, doc)
+        tokens = query.get_tokens()
+        profile.lap("preprocess")
+        spans = self.spotter.spot(tokens)
+        profile.lap("mention_detection")
+        num_spans = len(spans)
+        if self.mention_resolution is not None:
+            spans = self.__resolve_overlaps(spans)
+            profile.lap("mention_resolution")
+        mention_ens = self.get_candidates(spans)
+        profile.lap("candidates")
+        self.tracer.mention_detection(doc_id, mention_ens,
+                                      profile.total(["preprocess", "mention_detection", "candidates"]))
+        profile.lap("tracing")
+
+        disamb_ens = self.disambiguate(mention_ens, doc_id)
+        profile.lap("disambiguation")
+        self.tracer.disambiguation(doc_id, disamb_ens, profile.times["disambiguation"])
+        profile.lap("tracing")
+
+        profile.count("tokens", len(tokens))
+        profile.count("ngrams", self.spotter.num_lookups - num_lookups)
+        profile.count("spans", num_spans)
+        profile.count("resolved_spans", len(spans))
+        profile.count("mentions", len(mention_ens))
+        profile.count("candidates", mention_ens.num_candidates())
+        profile.count("linked", len(disamb_ens))
+        self.tracer.profile(profile)
+        return disamb_ens, spans, query
+
+    def annotate_batch(self, docs):
+        """Annotates a batch of documents.
+
+        :param docs: list of documents [(doc_id, doc), ...]
+        :return: list of disambiguated entities {men:en, ...}, in the order of the documents
+        """
+        return [self.annotate(doc, doc_id) for doc_id, doc in docs]
+
+    def annotate_batch_with_offsets(self, docs):
+        """Same as annotate_batch(), along with the character offsets of the mentions (see annotate_with_offsets()).
+
+        :param docs: list of documents [(doc_id, doc), ...]
+        :return: list of disambiguated entities {men:en, ...} and offsets {men: [(start, end), ...], ...}, in the
+            order of the documents
+        """
+        return [self.annotate_with_offsets(doc, doc_id) for doc_id, doc in docs]
+
     def parse(self, doc, doc_id):
         """Parses the document and returns all candidate mention-entity pairs.
 
-        :return: candidate entities {men:{en:cmn, ...}, ...}
+        :return: candidate entities (Candidates)
         """
-        query = Document(doc_id, doc)
-        candidate_ens = defaultdict(list)
-        for ngram in query.get_ngrams():
-            for en in self.commonness.get(ngram, {}):
-                if en != "_total":
-                    candidate_ens[ngram].append(en)
-        return candidate_ens
-
-    def disambiguate(self, candidate_entities):
+        return self.get_candidates(self.get_spans(Document(doc_id, doc)))
+
+    def get_settings(self):
+        """Returns the settings the annotations depend on (see AnnotationCache)."""
+        return "cmn", self.min_commonness, self.max_candidates, self.min_link_count, self.mention_resolution
+
+    def get_spans(self, query):
+        """Finds the mentions in a document (and resolves overlapping mentions, if enabled).
+
+        :param query: Document
+        :return: list of spans [Span(start, end, mention, mention_id), ...]
+        """
+        spans = self.spotter.spot(query.get_tokens())
+        if self.mention_resolution is not None:
+            spans = self.__resolve_overlaps(spans)
+        return spans
+
+    def __resolve_overlaps(self, spans):
+        """Selects non-overlapping spans among the mentions that are not pruned (see get_candidates())."""
+        spans = self.spotter.filter_spans(spans, self.min_link_count, self.min_commonness, self.max_candidates)
+        return self.spotter.resolve_overlaps(spans, self.mention_resolution)
+
+    def get_candidates(self, spans):
+        """Returns the candidate entities of the mentions found in the document.
+
+        :param spans: mentions found by the spotter
+        :return: candidate entities (Candidates)
+        """
+        # mentions are added in n-gram order (shortest first), as with Document.get_ngrams()
+        spans = sorted(spans, key=lambda s: (s.end - s.start, s.start))
+        if self.annotation_cache is not None:
+            key = AnnotationCache.get_mention_set_key(spans, (self.min_commonness, self.max_candidates,
+                                                              self.min_link_count))
+            candidates = self.annotation_cache.get_candidates(key)
+            if candidates is not None:
+                return candidates
+
+        mention_cands, counts = {}, defaultdict(int)
+        for span in spans:
+            if span.mention in mention_cands:  # repeated mention
+                counts[span.mention] += 1
+                continue
+            if self.min_link_count > 0 and self.commonness.get_mention_links(span.mention_id) < self.min_link_count:
+                continue
+            entity_ids, cmn = self.commonness.get_candidate_ids(span.mention_id, self.min_commonness,
+                                                                self.max_candidates)
+            if len(entity_ids) > 0:
+                mention_cands[span.mention] = span.mention_id, entity_ids, cmn
+                counts[span.mention] = 1
+        candidates = Candidates.build(self.commonness, mention_cands, counts)
+        if self.annotation_cache is not None:
+            self.annotation_cache.put_candidates(key, candidates)
+        return candidates
+
+    def disambiguate(self, candidates, doc_id=None):
         """
         Performs disambiguation and link each mention to a single entity.
 
-        :param candidate_entities: dictionary {men:[en1, ...], ...}
+        :param candidates: candidate entities (Candidates)
+        :param doc_id: document ID (used for tracing)
         :return: disambiguated entities {men:en, ...}
         """
         disamb_ens = {}
-        # For each mention, select the entity with the highest commonness score
-        for m in candidate_entities.keys():
-            max_cmn = 0
-            max_en = None
-            for e in candidate_entities[m]:
-                if self.commonness[m][e] > max_cmn:
-                    max_cmn = self.commonness[m][e]
-                    max_en = e
-            if max_en is not None:
-                disamb_ens[m] = (max_en, max_cmn)
+        # For each mention, select the entity with the highest commonness score (candidates are ordered by
+        # decreasing commonness, thus it is the first one)
+        for i, m in enumerate(candidates.mentions):
+            first = candidates.ptr[i]
+            max_cmn = float(candidates.cmn[first])
+            if max_cmn > 0:
+                disamb_ens[m] = (candidates.get_entity(first), max_cmn)
         return disamb_ens
 
 
@@ -87,7 +230,7 @@ def main():
 
     out_file_name = OUTPUT_DIR + "/output_cmn.txt"
     out_file = open(out_file_name, "w")
-    el = ELCmn()
+    el = ELCmn(tracer=DebugTracer())
 
     for doc_id, doc in sorted(snippets.items(), key=lambda item: int(item[0])):
         print("[" + doc_id + "]\t" + doc)
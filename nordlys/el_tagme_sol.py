@@ -7,148 +7,404 @@ Entity linking using TAGME's disgambiguation approach.
 """
 from __future__ import division
 from collections import defaultdict
-import csv
-import math
+from functools import partial
+import os
 
-from nordlys.config import SNIPPETS, OUTPUT_DIR, STATS_MENTION_ENTITY, STATS_ENTITY_INLINKS, STATS_ENTITY_PAIRS_INLINKS, ENTITY_COUNT
+import numpy
+
+from nordlys.annotation_cache import AnnotationCache
+from nordlys.candidates import Candidates
+from nordlys.cmn_index import load_cmn_index
+from nordlys.config import SNIPPETS, OUTPUT_DIR, RELATEDNESS_CACHE_SIZE, MIN_COMMONNESS, \
+    MAX_CANDIDATES, MIN_LINK_COUNT, MENTION_RESOLUTION, ANNOTATION_CACHE_SIZE, PAIRS_WORKING_SET_SIZE
 from nordlys.document import Document
 from nordlys.el_utils import ELUtils
+from nordlys.inlinks_store import load_inlinks_store
+from nordlys.relatedness import RelatednessCache, RelatednessEngine
+from nordlys.spotter import MentionSpotter
+from nordlys.tracing import DebugTracer, Profile
 
 
 class ELTagme(object):
 
-    def __init__(self):
-        self.commonness = dict()
-        self.get_commonness()
-        self.entity_inlinks = dict()
-        self.entity_pairs_inlinks = dict()
-        self.load_inlinks_stat()
+    NUMPY_SELECTION = 100  # the entities of mentions with at least this many candidates are selected with numpy
+
+    def __init__(self, cmn_index=None, inlinks_store=None, relatedness_cache_size=RELATEDNESS_CACHE_SIZE,
+                 relatedness_cache_file=None, pairs_working_set_size=PAIRS_WORKING_SET_SIZE,
+                 min_commonness=MIN_COMMONNESS, max_candidates=MAX_CANDIDATES, min_link_count=MIN_LINK_COUNT,
+                 mention_resolution=MENTION_RESOLUTION,
+                 annotation_cache_size=ANNOTATION_CACHE_SIZE, annotation_cache_file=None, tracer=None):
+        """
+        :param cmn_index: commonness index (opened from the default location if not provided)
+        :param inlinks_store: inlinks store (opened from the default location if not provided)
+        :param relatedness_cache_size: max number of entity pairs in the relatedness cache (0 disables it); the
+            relatedness scores are computed in a vectorized pass, thus the cache only pays off if they are costly
+            to compute (e.g., if the pairs table is read lazily from a slow disk)
+        :param relatedness_cache_file: file the relatedness cache is loaded from (if exists) and saved to (needs
+            a relatedness cache)
+        :param pairs_working_set_size: if > 0, the entity pairs table is read lazily, keeping at most this many
+            entity pairs in memory (see InlinksStore); not used if inlinks_store is provided
+        :param min_commonness: candidate entities with lower commonness are pruned
+        :param max_candidates: max number of candidate entities per mention, by commonness (0: no limit)
+        :param min_link_count: mentions linked fewer times are ignored
+        :param mention_resolution: strategy for selecting non-overlapping mentions (MentionSpotter.LONGEST or
+            MentionSpotter.LINKS); all mentions are used if None
+        :param annotation_cache_size: max number of documents in the annotation cache (0 disables it)
+        :param annotation_cache_file: sqlite database the annotation cache is persisted in, optional
+        :param tracer: receives tracing events (see nordlys.tracing); the linker is quiet if not provided
+        """
+        self.commonness = cmn_index
+        if self.commonness is None:
+            self.get_commonness()
+        self.spotter = MentionSpotter(self.commonness)
+        self.min_commonness = min_commonness
+        self.max_candidates = max_candidates
+        self.min_link_count = min_link_count
+        self.mention_resolution = mention_resolution
+        self.pairs_working_set_size = pairs_working_set_size
+        self.inlinks = inlinks_store
+        if self.inlinks is None:
+            self.load_inlinks_stat()
+        if self.commonness.vocab.meta != self.inlinks.vocab.meta:
+            # candidate entity IDs are used as inlinks store IDs as they are
+            raise ValueError("the commonness index and the inlinks store are built with different entity vocabularies")
+        if relatedness_cache_file is not None and relatedness_cache_size <= 0:
+            raise ValueError("a relatedness cache file is set, but the relatedness cache is disabled")
+        self.relatedness_cache = RelatednessCache(relatedness_cache_size)
+        self.relatedness_cache_file = relatedness_cache_file
+        if relatedness_cache_file is not None and os.path.exists(relatedness_cache_file):
+            self.relatedness_cache.load(relatedness_cache_file, self.inlinks)
+        cache = self.relatedness_cache if relatedness_cache_size > 0 else None
+        self.relatedness = RelatednessEngine(self.inlinks, cache=cache)
         self.k_th = 0.3  # score threshold parameter (default value)
+        self.annotation_cache = None
+        if annotation_cache_size > 0 or annotation_cache_file is not None:
+            self.annotation_cache = AnnotationCache([self.commonness.meta["source"], self.inlinks.meta["source"]],
+                                                    annotation_cache_size, annotation_cache_file)
+        self.tracer = tracer
 
     def get_commonness(self):
-        """Loads statistics and computes commonness."""
-        # load mention-entity stat
-        with open(STATS_MENTION_ENTITY, 'rb') as tsvfile:
-            reader = csv.reader(tsvfile, delimiter='\t')
-            for row in reader:
-                mention, entity, freq = row[0], row[1], int(row[2])
-                if mention not in self.commonness:
-                    self.commonness[mention] = dict()
-                self.commonness[mention][entity] = freq
-
-        # compute commonness by normalizing with total value
-        for m in self.commonness.keys():
-            for e in self.commonness[m].keys():
-                norm = self.commonness[m].get("_total", 0)
-                if e != "_total" and norm != 0:
-                    self.commonness[m][e] /= norm
+        """Opens the commonness index (it is compiled from the mention-entity stats on first use)."""
+        self.commonness = load_cmn_index()
 
     def load_inlinks_stat(self):
-        """Loads inlinks statistics."""
-        # entity inlink count
-        with open(STATS_ENTITY_INLINKS, 'rb') as tsvfile:
-            reader = csv.reader(tsvfile, delimiter='\t')
-            for row in reader:
-                entity, cnt = row[0], int(row[1])
-                self.entity_inlinks[entity] = cnt
-
-        # entity pairs inlink count
-        with open(STATS_ENTITY_PAIRS_INLINKS, 'rb') as tsvfile:
-            reader = csv.reader(tsvfile, delimiter='\t')
-            for row in reader:
-                e1, e2, cnt = row[0], row[1], int(row[2])
-                # we store it both ways for more convenient access
-                if e1 not in self.entity_pairs_inlinks:
-                    self.entity_pairs_inlinks[e1] = {}
-                if e2 not in self.entity_pairs_inlinks:
-                    self.entity_pairs_inlinks[e2] = {}
-                self.entity_pairs_inlinks[e1][e2] = cnt
-                self.entity_pairs_inlinks[e2][e1] = cnt
+        """Opens the inlinks store (it is compiled from the inlinks stats on first use)."""
+        self.inlinks = load_inlinks_store(working_set_size=self.pairs_working_set_size)
+
+    def save_relatedness_cache(self, max_entries=None):
+        """Saves the (max_entries most recently used) entries of the relatedness cache, so that a restarted linker
+        starts warm."""
+        if self.relatedness_cache_file is None:
+            raise ValueError("no relatedness cache file is set")
+        self.relatedness_cache.save(self.relatedness_cache_file, self.inlinks, max_entries)
 
     def annotate(self, doc, doc_id):
         """Performs entity linking and annotates the query."""
-        mention_ens = self.parse(doc, doc_id)
-        ELUtils.debug_mention_detection(mention_ens)
+        if self.tracer is not None:
+            return self.__annotate_traced(doc, doc_id)[0]
+        if self.annotation_cache is None:
+            return self.disambiguate(self.parse(doc, doc_id))
+        return self.__annotate_cached(Document(doc_id, doc))
 
-        disamb_ens = self.disambiguate(mention_ens)
-        ELUtils.debug_disambiguation(disamb_ens)
+    def annotate_with_offsets(self, doc, doc_id):
+        """Performs entity linking and returns the annotations along with the character offsets of their mentions
+        in the document.
 
+        :return: disambiguated entities {men:en, ...} and offsets {men: [(start, end), ...], ...}
+        """
+        if self.tracer is None:
+            query = Document(doc_id, doc)
+            spans = self.get_spans(query)
+            if self.annotation_cache is None:
+                disamb_ens = self.disambiguate(self.get_candidates(spans), doc_id)
+            else:
+                disamb_ens = self.__annotate_cached(query, spans)
+        else:
+            disamb_ens, spans, query = self.__annotate_traced(doc, doc_id)
+        return disamb_ens, MentionSpotter.get_offsets(spans, disamb_ens, query)
+
+    def __annotate_cached(self, query, spans=None):
+        """Same as annotate(), with the results looked up in (and added to) the annotation cache.
+
+        :param query: Document
+        :param spans: spans of the mentions in the document (they are found if not given)
+        :return: disambiguated entities {men:en, ...}
+        """
+        doc_key = AnnotationCache.get_doc_key(query.get_tokens(), self.get_settings())
+        disamb_ens = self.annotation_cache.get(doc_key)
+        if disamb_ens is None:
+            candidates = self.get_candidates(self.get_spans(query) if spans is None else spans)
+            disamb_ens = self.disambiguate(candidates, query.id)
+            self.annotation_cache.put(doc_key, disamb_ens, candidates.mentions)
         return disamb_ens
 
+    def __annotate_traced(self, doc, doc_id):
+        """Same as annotate(), with each phase timed and traced.
+
+        :return: disambiguated entities, the spans of the mentions and the document
+        """
+        profile = Profile(doc_id)
+        num_lookups = self.spotter.num_lookups
+        num_entities, num_pairs = self.relatedness.num_entities, self.relatedness.num_pairs
+        num_computed, cache_hits = self.relatedness.num_computed, self.relatedness_cache.hits
+        rows_read = self.inlinks.rows_read
+        query = Document(doc_id, doc)
+        tokens = query.get_tokens()
+        profile.lap("preprocess")
+        spans = self.spotter.spot(tokens)
+        profile.lap("mention_detection")
+        num_spans = len(spans)
+        if self.mention_resolution is not None:
+            spans = self.__resolve_overlaps(spans)
+            profile.lap("mention_resolution")
+        mention_ens = self.get_candidates(spans)
+        profile.lap("candidates")
+        self.tracer.mention_detection(doc_id, mention_ens,
+                                      profile.total(["preprocess", "mention_detection", "candidates"]))
+        profile.lap("tracing")
+
+        scores = self.relatedness.vote_scores(mention_ens)
+        profile.lap("voting")
+        disamb_ens = self.select_entities(mention_ens, scores, doc_id)
+        profile.lap("selection")
+        # vote(m',e) is computed for each candidate entity e of each mention m and all other mentions m'
+        votes = mention_ens.num_candidates() * max(len(mention_ens) - 1, 0)
+        self.tracer.disambiguation(doc_id, disamb_ens, profile.total(["voting", "selection"]), votes)
+        profile.lap("tracing")
+
+        profile.count("tokens", len(tokens))
+        profile.count("ngrams", self.spotter.num_lookups - num_lookups)
+        profile.count("spans", num_spans)
+        profile.count("resolved_spans", len(spans))
+        profile.count("mentions", len(mention_ens))
+        profile.count("candidates", mention_ens.num_candidates())
+        profile.count("entities", self.relatedness.num_entities - num_entities)
+        profile.count("votes", votes)
+        profile.count("relatedness_pairs", self.relatedness.num_pairs - num_pairs)
+        profile.count("relatedness_computed", self.relatedness.num_computed - num_computed)
+        profile.count("cache_hits", self.relatedness_cache.hits - cache_hits)
+        profile.count("pairs_rows_read", self.inlinks.rows_read - rows_read)
+        profile.count("linked", len(disamb_ens))
+        self.tracer.profile(profile)
+        return disamb_ens, spans, query
+
+    def annotate_batch(self, docs):
+        """Annotates a batch of documents; the relatedness computations are shared across the documents (see
+        RelatednessEngine.vote_scores_batch()). The results are the same as those of annotate().
+
+        :param docs: list of documents [(doc_id, doc), ...]
+        :return: list of disambiguated entities {men:en, ...}, in the order of the documents
+        """
+        if self.tracer is not None:
+            return [self.annotate(doc, doc_id) for doc_id, doc in docs]
+        return self.__annotate_batch([Document(doc_id, doc) for doc_id, doc in docs])
+
+    def annotate_batch_with_offsets(self, docs):
+        """Same as annotate_batch(), along with the character offsets of the mentions (see annotate_with_offsets()).
+
+        :param docs: list of documents [(doc_id, doc), ...]
+        :return: list of disambiguated entities {men:en, ...} and offsets {men: [(start, end), ...], ...}, in the
+            order of the documents
+        """
+        if self.tracer is not None:
+            return [self.annotate_with_offsets(doc, doc_id) for doc_id, doc in docs]
+        queries = [Document(doc_id, doc) for doc_id, doc in docs]
+        spans = [self.get_spans(query) for query in queries]
+        return [(disamb_ens, MentionSpotter.get_offsets(doc_spans, disamb_ens, query))
+                for query, doc_spans, disamb_ens in zip(queries, spans, self.__annotate_batch(queries, spans))]
+
+    def __annotate_batch(self, queries, spans=None):
+        """Annotates a batch of documents (see annotate_batch()).
+
+        :param queries: list of Document
+        :param spans: spans of the mentions of each document (they are found if not given)
+        :return: list of disambiguated entities {men:en, ...}
+        """
+        if self.annotation_cache is None:
+            results = [None] * len(queries)
+        else:
+            # only the documents that are not cached are annotated
+            doc_keys = [AnnotationCache.get_doc_key(query.get_tokens(), self.get_settings()) for query in queries]
+            results = [self.annotation_cache.get(doc_key) for doc_key in doc_keys]
+        missing = [i for i, disamb_ens in enumerate(results) if disamb_ens is None]
+        candidates = [self.get_candidates(self.get_spans(queries[i]) if spans is None else spans[i]) for i in missing]
+        scores = self.relatedness.vote_scores_batch(candidates)
+        for i, doc_candidates, doc_scores in zip(missing, candidates, scores):
+            results[i] = self.select_entities(doc_candidates, doc_scores, queries[i].id)
+            if self.annotation_cache is not None:
+                self.annotation_cache.put(doc_keys[i], results[i], doc_candidates.mentions)
+        return results
+
     def parse(self, doc, doc_id):
         """Parses the document and returns all candidate mention-entity pairs.
 
-        :return: candidate entities {men:{en:cmn, ...}, ...}
+        :return: candidate entities (Candidates)
         """
-        query = Document(doc_id, doc)
-        candidate_ens = defaultdict(list)
-        for ngram in query.get_ngrams():
-            for en in self.commonness.get(ngram, {}):
-                if en != "_total":
-                    candidate_ens[ngram].append(en)
-        return candidate_ens
+        return self.get_candidates(self.get_spans(Document(doc_id, doc)))
+
+    def get_settings(self):
+        """Returns the settings the annotations depend on (see AnnotationCache)."""
+        return "tagme", self.k_th, self.min_commonness, self.max_candidates, self.min_link_count, \
+            self.mention_resolution
 
-    def disambiguate(self, candidate_entities):
+    def get_spans(self, query):
+        """Finds the mentions in a document (and resolves overlapping mentions, if enabled).
+
+        :param query: Document
+        :return: list of spans [Span(start, end, mention, mention_id), ...]
+        """
+        spans = self.spotter.spot(query.get_tokens())
+        if self.mention_resolution is not None:
+            spans = self.__resolve_overlaps(spans)
+        return spans
+
+    def __resolve_overlaps(self, spans):
+        """Selects non-overlapping spans among the mentions that are not pruned (see get_candidates())."""
+        spans = self.spotter.filter_spans(spans, self.min_link_count, self.min_commonness, self.max_candidates)
+        return self.spotter.resolve_overlaps(spans, self.mention_resolution)
+
+    def get_candidates(self, spans):
+        """Returns the candidate entities of the mentions found in the document.
+
+        :param spans: mentions found by the spotter
+        :return: candidate entities (Candidates)
+        """
+        # mentions are added in n-gram order (shortest first), as with Document.get_ngrams()
+        spans = sorted(spans, key=lambda s: (s.end - s.start, s.start))
+        if self.annotation_cache is not None:
+            key = AnnotationCache.get_mention_set_key(spans, (self.min_commonness, self.max_candidates,
+                                                              self.min_link_count))
+            candidates = self.annotation_cache.get_candidates(key)
+            if candidates is not None:
+                return candidates
+
+        mention_cands, counts = {}, defaultdict(int)
+        for span in spans:
+            if span.mention in mention_cands:  # repeated mention
+                counts[span.mention] += 1
+                continue
+            if self.min_link_count > 0 and self.commonness.get_mention_links(span.mention_id) < self.min_link_count:
+                continue
+            entity_ids, cmn = self.commonness.get_candidate_ids(span.mention_id, self.min_commonness,
+                                                                self.max_candidates)
+            if len(entity_ids) > 0:
+                mention_cands[span.mention] = span.mention_id, entity_ids, cmn
+                counts[span.mention] = 1
+        candidates = Candidates.build(self.commonness, mention_cands, counts)
+        if self.annotation_cache is not None:
+            self.annotation_cache.put_candidates(key, candidates)
+        return candidates
+
+    def disambiguate(self, candidates, doc_id=None):
         """
         Performs disambiguation and link each mention to a single entity.
 
-        :param candidate_entities: dictionary {men:[en1, ...], ...}
+        :param candidates: candidate entities (Candidates)
+        :param doc_id: document ID (used for tracing)
+        :return: disambiguated entities {men:en, ...}
+        """
+        # 1) compute the voting-based scores of all mentions at once:
+        # score(m,e) = \sum_{m' \in  M_d\{m} } vote(m',e)
+        scores = self.relatedness.vote_scores(candidates)
+        return self.select_entities(candidates, scores, doc_id)
+
+    def annotate_sweep(self, doc, doc_id, k_values):
+        """Annotates the document with several values of the k_th parameter. Only the selection of entities depends
+        on k_th, thus the voting-based scores are computed once.
+
+        :param k_values: list of k_th values
+        :return: list of disambiguated entities {men:en, ...}, in the order of k_values
+        """
+        candidates = self.parse(doc, doc_id)
+        scores = self.relatedness.vote_scores(candidates)
+        return [self.select_entities(candidates, scores, doc_id, k_th) for k_th in k_values]
+
+    def select_entities(self, candidates, scores, doc_id=None, k_th=None):
+        """Selects a single entity for each mention based on the voting-based scores.
+
+        :param candidates: candidate entities (Candidates)
+        :param scores: voting-based scores of the candidates (array, see RelatednessEngine.vote_scores())
+        :param doc_id: document ID (used for tracing)
+        :param k_th: score threshold parameter (self.k_th if None)
         :return: disambiguated entities {men:en, ...}
         """
         disamb_ens = {}
         # For each mention
-        for m in candidate_entities.keys():
-            # 1) compute the voting-based score
-            score = {}
-            for e in candidate_entities[m]:
-                score[e] = 0
-                # score(m,e) = \sum_{m' \in  M_d\{m} } vote(m',e)
-                for m_ in candidate_entities.keys():
-                    if m != m_:
-                        for e_ in candidate_entities[m_]:
-                            score[e] += self.vote(e, m_, candidate_entities[m_])
-
+        for i, m in enumerate(candidates.mentions):
+            start, end = candidates.get_range(i)
             # 2) Consider the top-k percent of entities with the highest score
             # and select the one with the highest commonness score
-            top_k_ens = self.get_top_k(score)
-            print(m, top_k_ens)
-            max_cmn = -1
-            max_en = None
-            for en in top_k_ens:
-                cmn = self.commonness[m][en]
-                if cmn > max_cmn:
-                    max_en = en
-                    max_cmn = cmn
-            if max_en is not None:
-                disamb_ens[m] = (max_en, max_cmn)
+            dict_order = partial(candidates.get_dict_order, i)
+            if self.tracer is not None:
+                top_k_ens = self.get_top_k(scores[start:end].tolist(), k_th, dict_order)
+                self.tracer.top_k(doc_id, m, [candidates.get_entity(start + en) for en in top_k_ens])
+            max_en = start + self.select_top_k(scores[start:end], candidates.cmn[start:end], k_th, dict_order)
+            disamb_ens[m] = (candidates.get_entity(max_en), float(candidates.cmn[max_en]))
 
         return disamb_ens
 
-    def vote(self, e, m_, Em_):
-        """Computes voting score.
-        vote(m',e) = \sum_{e' \in E_m' \mathrm{WLM}(e,e') P(e'|m') / |E_m'|
-
-        :param e: candidate entity e
-        :param m_: mention m'
-        :param Em_: candidate entities for the mention m' (E_m')
+    def select_top_k(self, scores, cmn, k_th=None, dict_order=None):
+        """Selects the entity with the highest commonness among the top-k percent of the entities of a mention (see
+        get_top_k()). Ties are broken by the highest score, then by the order of the score dictionary TAGME used to
+        select entities from, i.e., the first entity in dict_order.
+
+        Only the lowest score of the top-k is needed, which is found without sorting all the entities. As candidates
+        are ordered by decreasing commonness, the first top-k entity has the highest commonness, and only the
+        following entities with the same commonness need to be compared to it.
+
+        :param scores: scores of the candidate entities of a mention (array)
+        :param cmn: commonness scores of the candidate entities (array, in decreasing order)
+        :param k_th: score threshold parameter (self.k_th if None)
+        :param dict_order: function returning the positions of the candidates in the order ties are broken (see
+            Candidates.get_dict_order()); only called if there is a tie. Ties are broken by the order of the
+            candidates if None.
+        :return: position of the selected entity (among the candidates of the mention)
         """
-        if len(Em_) == 0:
-            return 0
-
-        v = 0
-        for e_ in Em_:
-            v += self.get_relatedness(e, e_) * self.commonness[m_][e_]
-        return v / len(Em_)
-
-    def get_top_k(self, score):
-        """Returns top-k percent of the entities based on score(e,m)."""
-        k = int(round(len(score.keys()) * self.k_th))
-        k = 1 if k == 0 else k
-        sorted_rel_scores = sorted(score.items(), key=lambda item: item[1], reverse=True)
+        k = self.__get_k(len(scores), k_th)
+        if len(scores) >= self.NUMPY_SELECTION:
+            levels = numpy.unique(scores)  # distinct scores, in increasing order
+            min_score = levels[max(len(levels) - k, 0)]
+            first = int(numpy.argmax(scores >= min_score))
+            last = first + int(numpy.count_nonzero(cmn[first:] == cmn[first]))
+            tied = scores[first:last]
+            max_en = int(numpy.argmax(numpy.where(tied >= min_score, tied, -numpy.inf)))
+            tied_ens = (first + numpy.flatnonzero(tied == tied[max_en])).tolist()
+        else:
+            scores, cmn = scores.tolist(), cmn.tolist()
+            levels = sorted(set(scores), reverse=True)
+            min_score = levels[min(k, len(levels)) - 1]
+            tied_ens = []
+            for en in range(len(scores)):
+                if len(tied_ens) > 0 and cmn[en] < cmn[tied_ens[0]]:
+                    break
+                if scores[en] >= min_score:
+                    if len(tied_ens) == 0 or scores[en] > scores[tied_ens[0]]:
+                        tied_ens = [en]
+                    elif scores[en] == scores[tied_ens[0]]:
+                        tied_ens.append(en)
+
+        if len(tied_ens) > 1 and dict_order is not None:
+            tied_ens = set(tied_ens)
+            return next(en for en in dict_order() if en in tied_ens)
+        return tied_ens[0]
+
+    def get_top_k(self, scores, k_th=None, dict_order=None):
+        """Returns top-k percent of the entities based on score(e,m).
+
+        :param scores: scores of the candidate entities of a mention
+        :param k_th: score threshold parameter (self.k_th if None)
+        :param dict_order: function returning the positions of the candidates in the order ties are listed (see
+            select_top_k()); the order of the candidates is used if None
+        :return: positions of the top-k entities (among the candidates of the mention), by decreasing score
+        """
+        k = self.__get_k(len(scores), k_th)
+        ens = dict_order() if dict_order is not None else range(len(scores))
+        sorted_ens = sorted(ens, key=scores.__getitem__, reverse=True)
         top_k_ens = []
         count = 1
-        prev_rel_score = sorted_rel_scores[0][1]
-        for en, rel_score in sorted_rel_scores:
+        prev_rel_score = scores[sorted_ens[0]]
+        for en in sorted_ens:
+            rel_score = scores[en]
             if rel_score != prev_rel_score:
                 count += 1
             if count > k:
@@ -157,16 +413,10 @@ class ELTagme(object):
             prev_rel_score = rel_score
         return top_k_ens
 
-    def get_relatedness(self, e1, e2):
-        """Returns the relatedness score between two entities."""
-        # number of common inlinks
-        common = self.entity_pairs_inlinks[e1].get(e2, 0) if e1 in self.entity_pairs_inlinks else 0
-        if common == 0:  # no common inlinks
-            return 0
-
-        numerator = math.log(max(self.entity_inlinks[e1], self.entity_inlinks[e2])) - math.log(common)
-        denominator = math.log(ENTITY_COUNT) - math.log(min(self.entity_inlinks[e1], self.entity_inlinks[e2]))
-        return 1.0 - (numerator / denominator)
+    def __get_k(self, num_entities, k_th=None):
+        """Returns the number of distinct scores considered for the top-k percent of the entities (at least 1)."""
+        k = int(round(num_entities * (self.k_th if k_th is None else k_th)))
+        return 1 if k == 0 else k
 
 
 def main():
@@ -174,7 +424,7 @@ def main():
 
     out_file_name = OUTPUT_DIR + "/output_tagme.txt"
     out_file = open(out_file_name, "w")
-    el = ELTagme()
+    el = ELTagme(tracer=DebugTracer())
 
     for doc_id, doc in sorted(snippets.items(), key=lambda item: int(item[0])):
         print("[" + doc_id + "]\t" + doc)
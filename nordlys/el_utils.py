@@ -23,10 +23,22 @@ class ELUtils(object):
         for m, (e, score) in disamb_ens.iteritems():
             print("\t'" + m + "' => " + e + " (" + str(score) + ")")
 
+    @staticmethod
+    def format_annotations(doc_id, linked_ens, offsets=None, score_th=None):
+        """Returns entity linking results in the output format (one `docID score entityID mention page-id` line per
+        annotation). If the offsets of the mentions are given, they are added as a last column of comma separated
+        `start-end` offsets. If a score threshold is given, annotations with lower score are left out."""
+        lines = []
+        for men, (en, score) in linked_ens.iteritems():
+            if score_th is not None and score < score_th:
+                continue
+            line = str(doc_id) + "\t" + str(score) + "\t" + en + "\t" + men + "\tpage-id"
+            if offsets is not None:
+                line += "\t" + ",".join(str(start) + "-" + str(end) for start, end in offsets[men])
+            lines.append(line + "\n")
+        return "".join(lines)
+
     @staticmethod
     def write_to_file(doc_id, out_file, linked_ens):
         """Writes entity linking results to output file."""
-        out_str = ""
-        for men, (en, score) in linked_ens.iteritems():
-            out_str += str(doc_id) + "\t" + str(score) + "\t" + en + "\t" + men + "\tpage-id" + "\n"
-        out_file.write(out_str)
+        out_file.write(ELUtils.format_annotations(doc_id, linked_ens))
@@ -0,0 +1,82 @@
+"""
+Entity vocabulary shared by the statistics indices.
+
+The entities that can be linked, i.e., the candidate entities of the mention-entity statistics, are interned once:
+their sorted URIs are stored in a single blob, and the position of an entity is its ID. The commonness index and
+the inlinks store refer to entities by these IDs, thus the linkers work on integer IDs only, from candidate lookup
+to relatedness computation, and URIs are decoded only for the linked entities.
+
+  - entities.bin, entity_offsets.npy: sorted entity URIs
+  - meta.json: source file fingerprint (see IndexUtils)
+
+Usage: python -m nordlys.entity_vocab [mention_entity_file] [vocab_dir]
+"""
+import csv
+import sys
+
+from nordlys.config import STATS_MENTION_ENTITY, ENTITY_VOCAB_DIR
+from nordlys.index_utils import IndexUtils, StringTable
+
+
+class EntityVocab(object):
+    """Read-only, memory-mapped entity vocabulary."""
+
+    def __init__(self, vocab_dir=ENTITY_VOCAB_DIR):
+        self.vocab_dir = vocab_dir
+        self.meta = IndexUtils.load_meta(vocab_dir)
+        self.entities = StringTable(vocab_dir + "/entities.bin", vocab_dir + "/entity_offsets.npy")
+
+    def __len__(self):
+        return len(self.entities)
+
+    def get_entity(self, entity_id):
+        """Returns the URI of an entity ID."""
+        return self.entities[entity_id]
+
+    def get_entity_id(self, entity):
+        """Returns the ID of an entity URI, or -1 if it is unknown."""
+        return self.entities.index(entity)
+
+    def get_id_map(self):
+        """Returns the {en: id} mapping of all entities (used when building indices)."""
+        return {self.entities[i]: i for i in xrange(len(self.entities))}
+
+    @staticmethod
+    def build(stats_file=STATS_MENTION_ENTITY, vocab_dir=ENTITY_VOCAB_DIR):
+        """Compiles the entities of the mention-entity statistics file into a vocabulary."""
+        entities = set()
+        with open(stats_file, 'rb') as tsvfile:
+            reader = csv.reader(tsvfile, delimiter='\t')
+            for row in reader:
+                if row[1] != "_total":
+                    entities.add(row[1])
+
+        tmp_dir = IndexUtils.create_tmp_dir(vocab_dir)
+        StringTable.write(sorted(entities), tmp_dir + "/entities.bin", tmp_dir + "/entity_offsets.npy")
+        IndexUtils.commit(tmp_dir, vocab_dir, [stats_file], {"entities": len(entities)})
+
+
+_loaded = {}
+
+
+def load_entity_vocab(stats_file=STATS_MENTION_ENTITY, vocab_dir=ENTITY_VOCAB_DIR):
+    """Returns the entity vocabulary, building it first if it is missing or stale.
+    Vocabularies are opened once per process and shared by all indices.
+    """
+    if vocab_dir not in _loaded:
+        if IndexUtils.is_stale(vocab_dir, [stats_file]):
+            EntityVocab.build(stats_file, vocab_dir)
+        _loaded[vocab_dir] = EntityVocab(vocab_dir)
+    return _loaded[vocab_dir]
+
+
+def main(args):
+    stats_file = args[0] if len(args) > 0 else STATS_MENTION_ENTITY
+    vocab_dir = args[1] if len(args) > 1 else ENTITY_VOCAB_DIR
+    print("building entity vocabulary from " + stats_file + " ...")
+    EntityVocab.build(stats_file, vocab_dir)
+    print("vocabulary written to " + vocab_dir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -7,8 +7,13 @@ Matching condition: entities should match and mentions should be equal or contai
 """
 
 from __future__ import division
+import argparse
+from bisect import bisect_left
+from collections import defaultdict, deque
+from itertools import groupby, islice
+import json
+import multiprocessing
 import sys
-from collections import defaultdict
 
 
 class EvaluatorAnnot(object):
@@ -52,16 +57,278 @@ class EvaluatorAnnot(object):
         total_rec /= n
         total_f = 2 * total_prec * total_rec / (total_prec + total_rec)
 
+        print self.get_log(total_prec, total_rec, total_f)
+        metrics = {'prec': total_prec, 'rec': total_rec, 'f': total_f}
+        return metrics
+
+    @staticmethod
+    def get_log(total_prec, total_rec, total_f):
+        """Returns the evaluation results in a human-readable form."""
         log = "\n----------------" + "\nEvaluation results:\n" + \
               "Prec: " + str(round(total_prec, 4)) + "\n" +\
               "Rec:  " + str(round(total_rec, 4)) + "\n" + \
               "F1:   " + str(round(total_f, 4)) + "\n" + \
               "all:  " + str(round(total_prec, 4)) + ", " + str(round(total_rec, 4)) + ", " + str(round(total_f, 4))
-        print log
+        return log
+
+
+class EvaluatorSweep(object):
+    """
+    Evaluates the results for a list of score thresholds at once.
+    Results are parsed and matched against the qrels a single time; for each query, the scores of the true
+    and false positives are sorted, and the number of them above each threshold is found by binary search.
+    The metrics are the same as those of EvaluatorAnnot for each threshold.
+    """
+
+    def __init__(self, qrels, results):
+        self.qrels_dict = self.__group_by_queries(qrels)
+        self.results_dict = self.__group_by_queries(results, res=True)
+
+    @staticmethod
+    def __group_by_queries(file_lines, res=False):
+        """
+        Groups the lines by query id, keeping the highest score of each interpretation (of the results; the second
+        column of the qrels is a label, not a score).
+
+        :param file_lines: list of lines [[qid, score, en_id, mention, page_id], ...]
+        :return: {qid: {(men0, en0): score0, (men1, en01): score1, ..}, ..}; scores are None for the qrels
+        """
+        grouped_inters = defaultdict(dict)
+        for cols in file_lines:
+            if len(cols) > 2:
+                item = (cols[3].lower(), cols[2].lower())
+                if not res:
+                    grouped_inters[cols[0]][item] = None
+                    continue
+                score = float(cols[1])
+                if score > grouped_inters[cols[0]].get(item, float("-inf")):
+                    grouped_inters[cols[0]][item] = score
+        return grouped_inters
+
+    @staticmethod
+    def get_query_scores(query_qrels, query_results):
+        """
+        Matches the results of a single query against the qrels.
+
+        :param query_qrels: Query interpretations from Qrel {(men0, en0): None, ..}
+        :param query_results: Query interpretations from result file {(men0, en0): score0, ..}
+        :return: sorted lists of (1) the score from which each qrel is found in the results (i.e., the highest score
+            of the matching results) and (2) the scores of the results not found in the qrels
+        """
+        results_index = defaultdict(list)
+        for (mention, en), score in query_results.iteritems():
+            results_index[en].append((mention, score))
+        tp_scores = []
+        for qrel_mention, en in query_qrels:
+            scores = [score for mention, score in results_index.get(en, [])
+                      if mention_match(mention, qrel_mention)]
+            if len(scores) > 0:
+                tp_scores.append(max(scores))
+
+        qrels_index = index_items(query_qrels)
+        fp_scores = [score for res_item, score in query_results.iteritems()
+                     if not find_indexed_item(res_item, qrels_index)]
+        return sorted(tp_scores), sorted(fp_scores)
+
+    def eval(self, thresholds):
+        """
+        Calculates total precision, recall and F1 (macro averaging) for each threshold.
+
+        :param thresholds: list of score thresholds
+        :return: list of metrics [{'th': th, 'prec': prec, 'rec': rec, 'f': f}, ...], in the order of thresholds
+        """
+        total_prec = [0] * len(thresholds)
+        total_rec = [0] * len(thresholds)
+        for qid in sorted(self.qrels_dict):
+            tp_scores, fp_scores = self.get_query_scores(self.qrels_dict[qid], self.results_dict.get(qid, {}))
+            num_qrels = len(self.qrels_dict[qid])
+            for i, th in enumerate(thresholds):
+                # results with score >= th are considered
+                tp = len(tp_scores) - bisect_left(tp_scores, th)
+                fp = len(fp_scores) - bisect_left(fp_scores, th)
+                total_prec[i] += tp / (tp + fp) if tp + fp != 0 else 0
+                total_rec[i] += tp / num_qrels if num_qrels != 0 else 0
+
+        n = len(self.qrels_dict)  # number of queries
+        metrics = []
+        for i, th in enumerate(thresholds):
+            prec, rec = total_prec[i] / n, total_rec[i] / n
+            f = 2 * prec * rec / (prec + rec) if prec + rec != 0 else 0
+            metrics.append({'th': th, 'prec': prec, 'rec': rec, 'f': f})
+        return metrics
+
+    @staticmethod
+    def get_best(metrics):
+        """Returns the metrics of the threshold with the highest F1 (the first one in case of ties)."""
+        return max(metrics, key=lambda m: m['f'])  # max() returns the first maximal item
+
+    @staticmethod
+    def format_table(metrics):
+        """Returns the metrics as a table, followed by the best threshold."""
+        lines = ["Threshold\tPrec\tRec\tF1"]
+        for m in metrics:
+            lines.append(str(m['th']) + "\t" + str(round(m['prec'], 4)) + "\t" + str(round(m['rec'], 4)) + "\t" +
+                         str(round(m['f'], 4)))
+        best = EvaluatorSweep.get_best(metrics)
+        lines.append("Best F1: " + str(round(best['f'], 4)) + " (threshold " + str(best['th']) + ")")
+        return "\n".join(lines)
+
+
+class EvaluatorStream(object):
+    """
+    Evaluates qrels and results files sorted by query id (e.g., with `sort -n`) without loading them in memory.
+    Both files are read in parallel, one query at a time, and the queries can be evaluated by a pool of processes.
+    The metrics are the same as those of EvaluatorAnnot.
+    """
+
+    def __init__(self, qrels_file, results_file, score_th=0, num_processes=1, chunk_size=100):
+        """
+        :param num_processes: number of processes evaluating the queries
+        :param chunk_size: number of queries sent to a process at once
+        """
+        self.qrels_file = qrels_file
+        self.results_file = results_file
+        self.score_th = score_th
+        self.num_processes = num_processes
+        self.chunk_size = chunk_size
+
+    def get_chunks(self):
+        """Reads the qrels and results of the queries and splits them into chunks [(qid, qrels, results), ...]."""
+        queries = join_query_groups(read_query_groups(self.qrels_file),
+                                    read_query_groups(self.results_file, res=True, score_th=self.score_th))
+        while True:
+            chunk = list(islice(queries, self.chunk_size))
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+    def __eval_queries(self, eval_query_func):
+        """Evaluates all queries; yields the metrics of the queries [(qid, metrics), ...] in file order.
+        At most 2 chunks per process are in flight at any time.
+        """
+        if self.num_processes == 1:
+            for chunk in self.get_chunks():
+                for query_eval in eval_query_chunk(eval_query_func, chunk):
+                    yield query_eval
+            return
+
+        pool = multiprocessing.Pool(self.num_processes)
+        try:
+            pending = deque()
+            for chunk in self.get_chunks():
+                pending.append(pool.apply_async(eval_query_chunk, (eval_query_func, chunk)))
+                if len(pending) >= 2 * self.num_processes:
+                    for query_eval in pending.popleft().get():
+                        yield query_eval
+            while pending:
+                for query_eval in pending.popleft().get():
+                    yield query_eval
+        finally:
+            pool.close()
+            pool.join()
+
+    def eval(self, eval_query_func, query_out=None):
+        """
+        Evaluates all queries and calculates total precision, recall and F1 (macro averaging).
+
+        :param eval_query_func: A function that takes qrel and results for a query and returns evaluation metrics
+        :param query_out: file object the metrics of each query are written to (optional)
+        :return  Total precision, recall, and F1 for all queries
+        """
+        # only the precision and recall of the queries are kept
+        queries_eval = {}
+        for qid, metrics in self.__eval_queries(eval_query_func):
+            queries_eval[qid] = (metrics['prec'], metrics['rec'])
+            if query_out is not None:
+                query_out.write(qid + "\t" + str(round(metrics['prec'], 4)) + "\t" + str(round(metrics['rec'], 4)) +
+                                "\t" + str(round(metrics['f'], 4)) + "\n")
+
+        # summed in the same order as by EvaluatorAnnot
+        total_prec, total_rec, total_f = 0, 0, 0
+        for qid in sorted(queries_eval):
+            total_prec += queries_eval[qid][0]
+            total_rec += queries_eval[qid][1]
+
+        n = len(queries_eval)  # number of queries
+        total_prec /= n
+        total_rec /= n
+        total_f = 2 * total_prec * total_rec / (total_prec + total_rec)
+
+        print EvaluatorAnnot.get_log(total_prec, total_rec, total_f)
         metrics = {'prec': total_prec, 'rec': total_rec, 'f': total_f}
         return metrics
 
 
+def eval_query_chunk(eval_query_func, chunk):
+    """
+    Evaluates a chunk of queries.
+
+    :param chunk: list of queries [(qid, query_qrels, query_results), ...]
+    :return: list of metrics [(qid, metrics), ...]
+    """
+    return [(qid, eval_query_func(query_qrels, query_results)) for qid, query_qrels, query_results in chunk]
+
+
+def query_sort_key(qid):
+    """Returns the sort key of a query id (numeric ids are sorted by their value)."""
+    return (0, int(qid)) if qid.isdigit() else (1, qid)
+
+
+def read_query_groups(file_name, res=False, score_th=None):
+    """
+    Reads a file sorted by query id lazily and groups the lines by query id, one query at a time.
+
+    :param file_name: Name of file to be parsed
+    :return generator of (qid, {(men0, en0), (men1, en01), ..}); null entities (in qrels) are skipped
+    """
+    last_key = None
+    with open(file_name, "r") as efile:
+        lines = (cols for cols, is_null in read_lines(efile, res) if not is_null)
+        for qid, query_lines in groupby(lines, key=lambda cols: cols[0]):
+            key = query_sort_key(qid)
+            if last_key is not None and key <= last_key:
+                raise ValueError(file_name + " is not sorted by query id (at query " + qid + ")")
+            last_key = key
+            inters = set()
+            for cols in query_lines:
+                if len(cols) > 2:
+                    if res and (float(cols[1]) < score_th):
+                        continue
+                    inters.add((cols[3].lower(), cols[2].lower()))
+            if len(inters) > 0:
+                yield qid, inters
+
+
+def join_query_groups(qrels_groups, results_groups):
+    """
+    Pairs up the qrels and results of the queries; both are sorted by query id (see read_query_groups()).
+
+    :return generator of (qid, query_qrels, query_results), for each query of the qrels
+    """
+    results_groups = iter(results_groups)
+    res = next(results_groups, None)
+    for qid, query_qrels in qrels_groups:
+        key = query_sort_key(qid)
+        while res is not None and query_sort_key(res[0]) < key:
+            res = next(results_groups, None)
+        if res is not None and res[0] == qid:
+            yield qid, query_qrels, res[1]
+        else:
+            yield qid, query_qrels, set()
+
+
+def parse_thresholds(spec):
+    """
+    Parses a list of thresholds, given either as comma separated values ("0.1,0.5,0.9") or as a
+    start:stop:step grid ("0:1:0.1", both ends included).
+    """
+    if ":" not in spec:
+        return [float(th) for th in spec.split(",")]
+    start, stop, step = [float(x) for x in spec.split(":")]
+    num_steps = int(round((stop - start) / step))
+    return [round(start + i * step, 10) for i in range(num_steps + 1)]
+
+
 def erd_eval_query(query_qrels, query_results):
     """
     Evaluates a single query.
@@ -74,16 +341,20 @@ def erd_eval_query(query_qrels, query_results):
     fn = 0  # missed
     fp = 0  # incorrectly returned
 
+    # only the items of the same entity need to be compared, thus both sides are indexed by entity
+    qrels_index = index_items(query_qrels)
+    results_index = index_items(query_results)
+
     # ----- Query has at least an interpretation set. -----
     # Iterate over qrels to calculate TP and FN
     for qrel_item in query_qrels:
-        if find_item(qrel_item, query_results):
+        if find_indexed_item(qrel_item, results_index):
             tp += 1
         else:
             fn += 1
     # Iterate over results to calculate FP
     for res_item in query_results:
-        if not find_item(res_item, query_qrels):  # Finds the result in the qrels
+        if not find_indexed_item(res_item, qrels_index):  # Finds the result in the qrels
             fp += 1
 
     prec = tp / (tp+fp) if tp+fp != 0 else 0
@@ -101,12 +372,43 @@ def find_item(item_to_find, items_list):
     :param items_list: list of items to search in
     :return boolean
     """
-    is_found = False
-
     for item in items_list:
         if (item[1] == item_to_find[1]) and mention_match(item[0], item_to_find[0]):
-            is_found = True
-    return is_found
+            return True
+    return False
+
+
+def index_items(items_list):
+    """
+    Indexes items by entity.
+
+    :param items_list: list of items [(men, en), ...]
+    :return: {en: {men0, men1, ...}, ...}
+    """
+    index = defaultdict(set)
+    for mention, en in items_list:
+        index[en].add(mention)
+    return index
+
+
+def find_indexed_item(item_to_find, items_index):
+    """
+    Returns True if an item is found in the item index; same as find_item(), but only the mentions of the
+    item's entity are compared.
+
+    :param item_to_find: item to be found
+    :param items_index: items indexed by entity (see index_items())
+    :return boolean
+    """
+    mentions = items_index.get(item_to_find[1])
+    if not mentions:
+        return False
+    if item_to_find[0] in mentions:  # equal mentions match
+        return True
+    for mention in mentions:
+        if mention_match(mention, item_to_find[0]):
+            return True
+    return False
 
 
 def mention_match(mention1, mention2):
@@ -127,31 +429,68 @@ def parse_file(file_name, res=False):
     """
     null_lines = []
     file_lines = []
-    efile = open(file_name, "r")
-    for line in efile.readlines():
+    with open(file_name, "r") as efile:
+        for cols, is_null in read_lines(efile, res):
+            if is_null:
+                null_lines.append(cols)
+            else:
+                file_lines.append(cols)
+    return file_lines, null_lines
+
+
+def read_lines(efile, res=False):
+    """
+    Reads the lines of a file object lazily.
+
+    :return generator of ([qid, label, en_id, ...], is_null); only qrels lines can have null entities
+    """
+    for line in efile:
         if line.strip() == "":
             continue
         cols = line.strip().split("\t")
-        if (not res) and (cols[2].strip() == "*NONE*"):
-            null_lines.append(cols)
-        else:
-            file_lines.append(cols)
-    return file_lines, null_lines
+        yield cols, (not res) and (cols[2].strip() == "*NONE*")
 
 
 def main(args):
-    if len(args) < 2:
-        print "\tUsage: <qrel_file> <result_file> [score_threshold]"
-        exit(0)
-    print(args)
+    parser = argparse.ArgumentParser(description="Evaluation of entity linking results")
+    parser.add_argument("qrel_file")
+    parser.add_argument("result_file")
+    parser.add_argument("score_threshold", nargs="?", type=float, default=0,
+                        help="only the annotations with score >= threshold are considered")
+    parser.add_argument("--sweep", default=None, metavar="THRESHOLDS",
+                        help="evaluates a list of thresholds: comma separated values (0.1,0.5,0.9) or "
+                             "start:stop:step grid (0:1:0.05)")
+    parser.add_argument("--json", action="store_true", help="sweep results as JSON")
+    parser.add_argument("--stream", action="store_true",
+                        help="streaming evaluation of files sorted by query id (constant memory)")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="number of processes (streaming mode)")
+    parser.add_argument("-q", "--query-output", default=None, help="file per-query metrics are written to")
+    args = parser.parse_args(args)
+
+    if args.stream:
+        print "evaluating ..."
+        evaluator = EvaluatorStream(args.qrel_file, args.result_file, args.score_threshold, args.processes)
+        query_out = open(args.query_output, "w") if args.query_output else None
+        evaluator.eval(erd_eval_query, query_out)
+        if query_out is not None:
+            query_out.close()
+        return
+
     print "parsing qrel ..."
-    qrels, null_qrels = parse_file(args[0])  # here qrel does not contain null entities
+    qrels, null_qrels = parse_file(args.qrel_file)  # here qrel does not contain null entities
     print "parsing results ..."
-    results = parse_file(args[1], res=True)[0]
+    results = parse_file(args.result_file, res=True)[0]
     print "evaluating ..."
-    score_th = float(args[2]) if len(args) >= 3 else 0
-    evaluator = EvaluatorAnnot(qrels, results, score_th)
+    if args.sweep is not None:
+        metrics = EvaluatorSweep(qrels, results).eval(parse_thresholds(args.sweep))
+        if args.json:
+            print json.dumps({'thresholds': metrics, 'best': EvaluatorSweep.get_best(metrics)})
+        else:
+            print EvaluatorSweep.format_table(metrics)
+        return
+    evaluator = EvaluatorAnnot(qrels, results, args.score_threshold)
     evaluator.eval(erd_eval_query)
 
+
 if __name__ == '__main__':
     main(sys.argv[1:])
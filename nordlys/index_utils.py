@@ -0,0 +1,149 @@
+"""
+Utilities for the on-disk (memory-mapped) statistics indices.
+"""
+
+import json
+import mmap
+import os
+import shutil
+
+import numpy
+
+
+class StringTable(object):
+    """Sorted list of strings stored in a single blob, searchable via binary search."""
+
+    def __init__(self, blob_file, offsets_file):
+        self.__file = open(blob_file, "rb")
+        size = os.fstat(self.__file.fileno()).st_size
+        self.__blob = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else ""
+        self.__offsets = IndexUtils.load_array(offsets_file)
+        self.__size = len(self.__offsets) - 1
+
+    def __len__(self):
+        return self.__size
+
+    def __getitem__(self, i):
+        return self.__blob[int(self.__offsets[i]):int(self.__offsets[i + 1])]
+
+    def bisect_left(self, s, lo=0, hi=None):
+        """Returns the position where s would be inserted (first position with string >= s)."""
+        hi = self.__size if hi is None else hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid] < s:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def index(self, s):
+        """Returns the position of s, or -1 if it is not in the table."""
+        i = self.bisect_left(s)
+        if i < self.__size and self[i] == s:
+            return i
+        return -1
+
+    def prefix_range(self, prefix, lo=0, hi=None):
+        """Returns the range [lo, hi) of strings starting with the given prefix."""
+        hi = self.__size if hi is None else hi
+        lo = self.bisect_left(prefix, lo, hi)
+        # "\xff" does not occur in utf-8 encoded strings, so it sorts after all possible continuations
+        return lo, self.bisect_left(prefix + "\xff", lo, hi)
+
+    @staticmethod
+    def write(strings, blob_file, offsets_file):
+        """Writes a (sorted) list of strings to disk."""
+        offsets = numpy.zeros(len(strings) + 1, dtype=numpy.int64)
+        with open(blob_file, "wb") as f:
+            pos = 0
+            for i, s in enumerate(strings):
+                f.write(s)
+                pos += len(s)
+                offsets[i + 1] = pos
+        numpy.save(offsets_file, offsets)
+
+
+class ArrayFile(object):
+    """1-dimensional array of a .npy file, read from disk on demand (ranges are read with plain file reads, the file
+    is not memory-mapped)."""
+
+    def __init__(self, array_file):
+        self.array_file = array_file
+        with open(array_file, "rb") as f:
+            version = numpy.lib.format.read_magic(f)
+            if version == (1, 0):
+                _, _, self.dtype = numpy.lib.format.read_array_header_1_0(f)
+            else:
+                _, _, self.dtype = numpy.lib.format.read_array_header_2_0(f)
+            self.offset = f.tell()
+        self.__file = None
+        self.__pid = None
+
+    def read(self, start, end):
+        """Returns the elements [start, end) of the array."""
+        if self.__file is None or self.__pid != os.getpid():
+            # forked processes share file positions, thus each process opens the file for itself
+            self.__file = open(self.array_file, "rb")
+            self.__pid = os.getpid()
+        self.__file.seek(self.offset + start * self.dtype.itemsize)
+        return numpy.fromfile(self.__file, dtype=self.dtype, count=end - start)
+
+
+class IndexUtils(object):
+
+    @staticmethod
+    def load_array(array_file):
+        """Opens a .npy file via mmap.
+        The array is returned as a plain ndarray view, which is much faster to index than numpy.memmap.
+        """
+        return numpy.load(array_file, mmap_mode="r").view(numpy.ndarray)
+
+    @staticmethod
+    def fingerprint(stats_files):
+        """Identifies the version of the source statistics files."""
+        fingerprint = []
+        for stats_file in stats_files:
+            st = os.stat(stats_file)
+            fingerprint.append({"file": os.path.abspath(stats_file), "size": st.st_size, "mtime": st.st_mtime})
+        return fingerprint
+
+    @staticmethod
+    def is_stale(index_dir, stats_files, version=1):
+        """Checks whether the index needs to be (re)built from the statistics files.
+
+        :param version: current format version of the index (indices written in another format are stale)
+        """
+        meta = IndexUtils.load_meta(index_dir)
+        return meta is None or meta.get("source") != IndexUtils.fingerprint(stats_files) or \
+            meta.get("version", 1) != version
+
+    @staticmethod
+    def load_meta(index_dir):
+        """Returns the metadata of an index (or None if the index does not exist)."""
+        meta_file = index_dir + "/meta.json"
+        if not os.path.exists(meta_file):
+            return None
+        with open(meta_file, "r") as f:
+            return json.load(f)
+
+    @staticmethod
+    def create_tmp_dir(index_dir):
+        """Creates an empty directory for building an index.
+        Files are written to a temporary directory, which then replaces the index (see commit()).
+        """
+        tmp_dir = index_dir + ".tmp"
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        return tmp_dir
+
+    @staticmethod
+    def commit(tmp_dir, index_dir, stats_files, meta):
+        """Writes the index metadata and moves the index from tmp_dir to its final location."""
+        meta = dict(meta, source=IndexUtils.fingerprint(stats_files))
+        with open(tmp_dir + "/meta.json", "w") as f:
+            json.dump(meta, f)
+        if os.path.exists(index_dir):
+            shutil.rmtree(index_dir)
+        os.rename(tmp_dir, index_dir)
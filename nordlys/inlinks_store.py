@@ -0,0 +1,291 @@
+"""
+Compiled entity inlinks store.
+
+The entity inlinks and entity pairs inlinks statistics are compiled once into a set of flat binary files. Entities
+are referred to by their IDs in the entity vocabulary (see nordlys.entity_vocab); the statistics of entities outside
+the vocabulary are left out, as these entities are never candidates.
+
+  - inlinks.npy: number of inlinks of each entity of the vocabulary
+  - pairs_ptr.npy, pairs_neighbors.npy, pairs_counts.npy: symmetric sparse matrix of common inlink counts
+    in CSR format; the entities having common inlinks with entity i are pairs_neighbors[ptr[i]:ptr[i+1]]
+    (sorted), and the corresponding counts are pairs_counts[ptr[i]:ptr[i+1]]
+  - meta.json: source files fingerprint (see IndexUtils)
+
+The files are memory-mapped, so multiple linker processes share one page-cached copy. Alternatively, the pairs
+table can be read lazily: only the rows of the entities that are needed (e.g., the candidate entities of a batch of
+documents, see load_rows()) are read from disk, into a working set of bounded size (see PairsWorkingSet).
+
+Usage: python -m nordlys.inlinks_store [entity_inlinks_file] [entity_pairs_inlinks_file] [index_dir]
+                                      [mention_entity_file] [vocab_dir]
+"""
+from array import array
+from collections import OrderedDict
+import csv
+import sys
+
+import numpy
+
+from nordlys.config import STATS_ENTITY_INLINKS, STATS_ENTITY_PAIRS_INLINKS, INLINKS_INDEX_DIR, \
+    STATS_MENTION_ENTITY, ENTITY_VOCAB_DIR, PAIRS_WORKING_SET_SIZE
+from nordlys.entity_vocab import load_entity_vocab
+from nordlys.index_utils import IndexUtils, ArrayFile
+
+
+class PairsWorkingSet(object):
+    """Rows of the pairs table held in memory. The size of the working set is bounded by the total number of entries
+    (entity pairs) of its rows; the least recently used rows are evicted beyond that.
+    """
+
+    def __init__(self, max_size):
+        """
+        :param max_size: max number of entity pairs (a single row is kept even if it is larger)
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.__rows = OrderedDict()
+
+    def __len__(self):
+        return len(self.__rows)
+
+    def get(self, entity_id):
+        """Returns the row of an entity (marking it as recently used), or None if it is not in the working set."""
+        row = self.__rows.pop(entity_id, None)
+        if row is not None:
+            self.__rows[entity_id] = row
+        return row
+
+    def put(self, entity_id, row):
+        """Adds the row of an entity (neighbors, counts), evicting the least recently used rows if needed."""
+        self.__rows[entity_id] = row
+        self.size += len(row[0])
+        while self.size > self.max_size and len(self.__rows) > 1:
+            _, (neighbors, _) = self.__rows.popitem(last=False)
+            self.size -= len(neighbors)
+
+
+class InlinksStore(object):
+    """Read-only, memory-mapped store of entity inlink statistics."""
+
+    VERSION = 2  # format version
+
+    def __init__(self, index_dir=INLINKS_INDEX_DIR, vocab=None, working_set_size=PAIRS_WORKING_SET_SIZE):
+        """
+        :param vocab: entity vocabulary the store was built with (EntityVocab; opened from the default location if
+            not provided)
+        :param working_set_size: max number of entity pairs held in memory if the pairs table is read lazily
+            (0: the pairs table is memory-mapped)
+        """
+        self.index_dir = index_dir
+        self.meta = IndexUtils.load_meta(index_dir)
+        self.vocab = vocab if vocab is not None else load_entity_vocab()
+        self.inlinks = IndexUtils.load_array(index_dir + "/inlinks.npy")
+        self.__ptr = IndexUtils.load_array(index_dir + "/pairs_ptr.npy")
+        self.working_set = None
+        self.rows_read = 0  # rows of the pairs table read from disk (lazy mode)
+        if working_set_size > 0:
+            self.working_set = PairsWorkingSet(working_set_size)
+            self.__neighbors = ArrayFile(index_dir + "/pairs_neighbors.npy")
+            self.__counts = ArrayFile(index_dir + "/pairs_counts.npy")
+            self.__empty_row = numpy.zeros(0, dtype=self.__neighbors.dtype), numpy.zeros(0, self.__counts.dtype)
+        else:
+            self.__neighbors = IndexUtils.load_array(index_dir + "/pairs_neighbors.npy")
+            self.__counts = IndexUtils.load_array(index_dir + "/pairs_counts.npy")
+
+    def get_entity(self, entity_id):
+        """Returns the URI of an entity ID."""
+        return self.vocab.get_entity(entity_id)
+
+    def get_entity_id(self, entity):
+        """Returns the ID of an entity URI, or -1 if it is unknown."""
+        return self.vocab.get_entity_id(entity)
+
+    def get_inlinks(self, entity_id):
+        """Returns the number of inlinks of an entity."""
+        return int(self.inlinks[entity_id]) if entity_id >= 0 else 0
+
+    def get_row(self, entity_id):
+        """Returns the entities having common inlinks with an entity (sorted IDs) and the number of common inlinks
+        (arrays). In lazy mode, the row is read from disk if it is not in the working set.
+        """
+        start, end = int(self.__ptr[entity_id]), int(self.__ptr[entity_id + 1])
+        if self.working_set is None:
+            return self.__neighbors[start:end], self.__counts[start:end]
+        if start == end:
+            return self.__empty_row
+        row = self.working_set.get(entity_id)
+        if row is None:
+            row = self.__neighbors.read(start, end), self.__counts.read(start, end)
+            self.working_set.put(entity_id, row)
+            self.rows_read += 1
+        return row
+
+    def load_rows(self, entity_ids):
+        """Reads the rows of the given entities into the working set, in the order of the entity IDs (i.e.,
+        sequentially from disk). Nothing is done if the pairs table is memory-mapped.
+
+        :param entity_ids: entity IDs (e.g., the candidate entities of a batch of documents)
+        """
+        if self.working_set is None:
+            return
+        for e in sorted(set(entity_ids)):
+            if e >= 0:
+                self.get_row(e)
+
+    def common_inlinks(self, e1, e2):
+        """Returns the number of common inlinks of two entities (given by their IDs)."""
+        if e1 < 0 or e2 < 0:
+            return 0
+        neighbors, counts = self.get_row(e1)
+        pos = int(numpy.searchsorted(neighbors, e2))
+        if pos < len(neighbors) and neighbors[pos] == e2:
+            return int(counts[pos])
+        return 0
+
+    def common_inlinks_many(self, ids1, ids2):
+        """Returns the number of common inlinks for all pairs of entities (given by their IDs), as a dense matrix.
+        Relatedness computations use the sparse list of common_inlinks_pairs() instead, which does not grow with
+        |ids1| x |ids2|.
+
+        :param ids1: list of entity IDs
+        :param ids2: list of entity IDs
+        :return: |ids1| x |ids2| matrix of common inlink counts
+        """
+        ids2 = numpy.asarray(ids2, dtype=numpy.int64)
+        common = numpy.zeros((len(ids1), len(ids2)), dtype=numpy.int64)
+        if len(ids2) == 0:
+            return common
+        for i, e1 in enumerate(ids1):
+            if e1 < 0:
+                continue
+            neighbors, counts = self.get_row(e1)
+            if len(neighbors) == 0:
+                continue
+            pos = numpy.minimum(numpy.searchsorted(neighbors, ids2), len(neighbors) - 1)
+            match = neighbors[pos] == ids2
+            common[i, match] = counts[pos[match]]
+        return common
+
+    def common_inlinks_pairs(self, ids):
+        """Returns the pairs of the given entities that have common inlinks, as a sparse (COO) list. Only the rows of
+        the given entities are scanned, thus the cost depends on the number of pairs found, not on |ids|^2.
+
+        :param ids: list of distinct entity IDs
+        :return: positions (i, j) of the entities of each pair in ids, with i <= j, and the number of common inlinks
+            of the pairs (arrays)
+        """
+        ids = numpy.asarray(ids, dtype=numpy.int64)
+        order = numpy.argsort(ids, kind="mergesort")
+        sorted_ids = ids[order]
+        rows, cols, common = [], [], []
+        for i, e in enumerate(ids.tolist()):
+            if e < 0:
+                continue
+            neighbors, counts = self.get_row(e)
+            if len(neighbors) == 0:
+                continue
+            pos = numpy.minimum(numpy.searchsorted(sorted_ids, neighbors), len(ids) - 1)
+            match = sorted_ids[pos] == neighbors
+            j = order[pos[match]]
+            # the table is symmetric, thus each pair is taken from the row of its first entity
+            upper = j >= i
+            rows.append(numpy.full(numpy.count_nonzero(upper), i, dtype=numpy.int64))
+            cols.append(j[upper])
+            common.append(counts[match][upper].astype(numpy.int64))
+        if len(rows) == 0:
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64), \
+                numpy.zeros(0, dtype=numpy.int64)
+        return numpy.concatenate(rows), numpy.concatenate(cols), numpy.concatenate(common)
+
+    @staticmethod
+    def build(inlinks_file=STATS_ENTITY_INLINKS, pairs_file=STATS_ENTITY_PAIRS_INLINKS, index_dir=INLINKS_INDEX_DIR,
+              vocab=None):
+        """Compiles the entity inlinks and entity pairs inlinks statistics files into a store.
+
+        :param vocab: entity vocabulary (EntityVocab); it is opened from the default location (and built, if needed)
+            if not provided
+        """
+        vocab = vocab if vocab is not None else load_entity_vocab()
+        entity_ids = vocab.get_id_map()
+
+        # entity inlink count
+        inlinks = numpy.zeros(len(vocab), dtype=numpy.int64)
+        with open(inlinks_file, 'rb') as tsvfile:
+            reader = csv.reader(tsvfile, delimiter='\t')
+            for row in reader:
+                e = entity_ids.get(row[0])
+                if e is not None:
+                    inlinks[e] = int(row[1])
+
+        # entity pairs inlink count
+        rows, cols, counts = array("l"), array("l"), array("l")
+        with open(pairs_file, 'rb') as tsvfile:
+            reader = csv.reader(tsvfile, delimiter='\t')
+            for row in reader:
+                e1, e2 = entity_ids.get(row[0]), entity_ids.get(row[1])
+                if e1 is None or e2 is None:
+                    continue
+                cnt = int(row[2])
+                # we store it both ways for more convenient access
+                rows.extend((e1, e2))
+                cols.extend((e2, e1))
+                counts.extend((cnt, cnt))
+        del entity_ids
+
+        rows = numpy.array(rows, dtype=numpy.int64)
+        cols = numpy.array(cols, dtype=numpy.int64)
+        counts = numpy.array(counts, dtype=numpy.int64)
+        # sort by (row, col); for repeated pairs the last value is kept (the sort is stable)
+        order = numpy.lexsort((cols, rows))
+        rows, cols, counts = rows[order], cols[order], counts[order]
+        last = numpy.ones(len(rows), dtype=bool)
+        last[:-1] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        rows, cols, counts = rows[last], cols[last], counts[last]
+        ptr = numpy.zeros(len(vocab) + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(rows, minlength=len(vocab)), out=ptr[1:])
+
+        tmp_dir = IndexUtils.create_tmp_dir(index_dir)
+        numpy.save(tmp_dir + "/inlinks.npy", inlinks)
+        numpy.save(tmp_dir + "/pairs_ptr.npy", ptr)
+        numpy.save(tmp_dir + "/pairs_neighbors.npy", cols.astype(numpy.int32))
+        numpy.save(tmp_dir + "/pairs_counts.npy", counts.astype(numpy.int32))
+        # the store depends on the vocabulary, thus on the mention-entity statistics too
+        stats_files = [inlinks_file, pairs_file] + [src["file"] for src in vocab.meta["source"]]
+        IndexUtils.commit(tmp_dir, index_dir, stats_files,
+                          {"entities": len(vocab), "pairs": len(rows) // 2, "version": InlinksStore.VERSION})
+
+
+_loaded = {}
+
+
+def load_inlinks_store(inlinks_file=STATS_ENTITY_INLINKS, pairs_file=STATS_ENTITY_PAIRS_INLINKS,
+                       index_dir=INLINKS_INDEX_DIR, stats_file=STATS_MENTION_ENTITY, vocab_dir=ENTITY_VOCAB_DIR,
+                       working_set_size=PAIRS_WORKING_SET_SIZE):
+    """Returns the inlinks store, building it (and the entity vocabulary) first if it is missing or stale.
+    Stores are opened once per process (and working set size) and shared by all linkers.
+
+    :param stats_file: mention-entity statistics file the entity vocabulary is built from
+    :param working_set_size: max number of entity pairs held in memory if the pairs table is read lazily
+        (0: the pairs table is memory-mapped)
+    """
+    key = (index_dir, working_set_size)
+    if key not in _loaded:
+        vocab = load_entity_vocab(stats_file, vocab_dir)
+        if IndexUtils.is_stale(index_dir, [inlinks_file, pairs_file, stats_file], InlinksStore.VERSION):
+            InlinksStore.build(inlinks_file, pairs_file, index_dir, vocab)
+        _loaded[key] = InlinksStore(index_dir, vocab, working_set_size)
+    return _loaded[key]
+
+
+def main(args):
+    inlinks_file = args[0] if len(args) > 0 else STATS_ENTITY_INLINKS
+    pairs_file = args[1] if len(args) > 1 else STATS_ENTITY_PAIRS_INLINKS
+    index_dir = args[2] if len(args) > 2 else INLINKS_INDEX_DIR
+    stats_file = args[3] if len(args) > 3 else STATS_MENTION_ENTITY
+    vocab_dir = args[4] if len(args) > 4 else ENTITY_VOCAB_DIR
+    print("building inlinks store from " + inlinks_file + " and " + pairs_file + " ...")
+    InlinksStore.build(inlinks_file, pairs_file, index_dir, load_entity_vocab(stats_file, vocab_dir))
+    print("store written to " + index_dir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,53 @@
+"""
+Bounded cache with least-recently-used eviction.
+"""
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+
+    def __init__(self, max_size):
+        """
+        :param max_size: maximum number of entries; the least recently used ones are evicted beyond that
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__items = OrderedDict()
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __contains__(self, key):
+        return key in self.__items
+
+    def get(self, key, default=None):
+        """Returns the value for key (marking it as recently used), or default if it is not cached."""
+        try:
+            value = self.__items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.__items[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Adds an entry, evicting the least recently used one if the cache is full."""
+        if self.max_size <= 0:
+            return
+        if key in self.__items:
+            del self.__items[key]
+        elif len(self.__items) >= self.max_size:
+            self.__items.popitem(last=False)
+        self.__items[key] = value
+
+    def items(self):
+        """Returns the cached entries, from the least to the most recently used."""
+        return self.__items.items()
+
+    def clear(self):
+        self.__items.clear()
+        self.hits = 0
+        self.misses = 0
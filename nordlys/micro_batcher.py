@@ -0,0 +1,140 @@
+"""
+Micro-batching of annotation requests.
+
+Documents submitted by concurrent callers (e.g., the request threads of nordlys.server) are collected into a
+batch until either the batch is full or the batching window has passed since the first document arrived. The
+batch is then annotated at once with the linker's annotate_batch(), which shares candidate entity ID maps and
+relatedness computations across the documents, and each caller's future is resolved with its own results. With
+offsets, the batch is annotated with annotate_batch_with_offsets(), and the futures also hold the offsets of the
+mentions.
+
+A single worker thread runs the linker, thus the linker is never used concurrently.
+"""
+
+from collections import namedtuple
+import Queue
+import threading
+import time
+
+_Request = namedtuple("_Request", ["doc_id", "doc", "future"])
+
+
+class Future(object):
+    """Result of an annotation request, available once the request's batch has been annotated."""
+
+    def __init__(self):
+        self.__done = threading.Event()
+        self.__result = None
+        self.__exception = None
+
+    def set_result(self, result):
+        self.__result = result
+        self.__done.set()
+
+    def set_exception(self, exception):
+        self.__exception = exception
+        self.__done.set()
+
+    def done(self):
+        return self.__done.is_set()
+
+    def result(self, timeout=None):
+        """Waits for the result and returns it (or raises the exception of the annotation)."""
+        if not self.__done.wait(timeout):
+            raise RuntimeError("annotation timed out")
+        if self.__exception is not None:
+            raise self.__exception
+        return self.__result
+
+
+class MicroBatcher(object):
+
+    def __init__(self, linker, max_batch_size=32, window=0.005, offsets=False):
+        """
+        :param linker: entity linker with an annotate_batch() method (ELCmn or ELTagme instance)
+        :param max_batch_size: maximum number of documents per batch
+        :param window: max time (in seconds) to wait for more documents after the first one of a batch arrived
+        :param offsets: if True, the offsets of the mentions are returned along with the annotations
+        """
+        self.linker = linker
+        self.__annotate_batch = linker.annotate_batch_with_offsets if offsets else linker.annotate_batch
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.num_batches = 0
+        self.num_docs = 0
+        self.__queue = Queue.Queue()
+        self.__worker = None
+
+    def start(self):
+        """Starts the worker thread."""
+        if self.__worker is None:
+            self.__worker = threading.Thread(target=self.__run)
+            self.__worker.daemon = True
+            self.__worker.start()
+
+    def stop(self):
+        """Annotates the pending documents and stops the worker thread."""
+        if self.__worker is not None:
+            self.__queue.put(None)
+            self.__worker.join()
+            self.__worker = None
+
+    def submit(self, doc, doc_id):
+        """Submits a document for annotation.
+
+        :return: Future of the disambiguated entities {men:en, ...} (and of their offsets
+            {men: [(start, end), ...], ...}, see __init__())
+        """
+        future = Future()
+        self.__queue.put(_Request(doc_id, doc, future))
+        return future
+
+    def annotate(self, doc, doc_id, timeout=None):
+        """Annotates a document (blocks until the document's batch has been annotated)."""
+        return self.submit(doc, doc_id).result(timeout)
+
+    def __get_batch(self):
+        """Waits for the first document, then collects documents until the batch is full or the window has passed.
+
+        :return: list of requests, and whether the batcher has been stopped
+        """
+        request = self.__queue.get()
+        if request is None:
+            return [], True
+        batch = [request]
+        deadline = time.time() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            try:
+                request = self.__queue.get(timeout=remaining) if remaining > 0 else self.__queue.get_nowait()
+            except Queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def __run(self):
+        stopped = False
+        while not stopped:
+            batch, stopped = self.__get_batch()
+            if len(batch) == 0:
+                continue
+            try:
+                results = self.__annotate_batch([(request.doc_id, request.doc) for request in batch])
+            except Exception:
+                # the documents are annotated one by one, so that only the failing requests get the exception
+                self.__run_each(batch)
+            else:
+                for request, result in zip(batch, results):
+                    request.future.set_result(result)
+            self.num_batches += 1
+            self.num_docs += len(batch)
+
+    def __run_each(self, batch):
+        """Annotates the documents of a batch separately."""
+        for request in batch:
+            try:
+                request.future.set_result(self.__annotate_batch([(request.doc_id, request.doc)])[0])
+            except Exception as e:
+                request.future.set_exception(e)
@@ -0,0 +1,92 @@
+"""
+Effect of candidate pruning on the speed and effectiveness of entity linking.
+
+The documents are annotated with each combination of the given pruning settings (minimum commonness, max number
+of candidates per mention, minimum mention link count). For each setting, the report shows the number of candidate
+entities and votes per document, the annotation time, and the precision, recall and F1 of the results (see
+nordlys.evaluator_annot).
+
+Usage: python -m nordlys.pruning_report [-m cmn|tagme] [--min-cmn 0,0.01] [--max-cands 0,20] [--min-links 0,10]
+                                        [-t score_threshold] [docs_file] [qrel_file]
+"""
+
+from __future__ import division
+import argparse
+from itertools import product
+import sys
+import time
+
+from nordlys.cmn_index import load_cmn_index
+from nordlys.config import SNIPPETS, DATA_DIR
+from nordlys.document import Document
+from nordlys.el_cmn_sol import ELCmn
+from nordlys.el_tagme_sol import ELTagme
+from nordlys.el_utils import ELUtils
+from nordlys.evaluator_annot import EvaluatorSweep, parse_file
+from nordlys.inlinks_store import load_inlinks_store
+
+
+def evaluate_setting(method, docs, qrels, score_th, min_commonness, max_candidates, min_link_count):
+    """Annotates the documents with a pruning setting, and measures its cost and effectiveness.
+
+    :param docs: list of documents [(doc_id, doc), ...]
+    :param qrels: parsed qrels (see evaluator_annot.parse_file())
+    :return: dictionary of results
+    """
+    pruning = {"min_commonness": min_commonness, "max_candidates": max_candidates, "min_link_count": min_link_count}
+    if method == "cmn":
+        linker = ELCmn(load_cmn_index(), **pruning)
+    else:
+        linker = ELTagme(load_cmn_index(), load_inlinks_store(), **pruning)
+
+    start = time.time()
+    results = [(doc_id, linker.annotate(doc, doc_id)) for doc_id, doc in docs]
+    elapsed = time.time() - start
+
+    num_candidates, num_votes = 0, 0
+    for doc_id, doc in docs:
+        candidates = linker.parse(doc, doc_id)
+        num_cands = candidates.num_candidates()
+        num_candidates += num_cands
+        num_votes += num_cands * max(len(candidates) - 1, 0)
+
+    result_lines = [line.split("\t") for doc_id, linked_ens in results
+                    for line in ELUtils.format_annotations(doc_id, linked_ens).splitlines()]
+    metrics = EvaluatorSweep(qrels, result_lines).eval([score_th])[0]
+    return dict(pruning, candidates=num_candidates / len(docs), votes=num_votes / len(docs), time=elapsed,
+                docs_per_sec=len(docs) / elapsed if elapsed > 0 else 0, prec=metrics["prec"], rec=metrics["rec"],
+                f=metrics["f"])
+
+
+def format_report(rows):
+    """Returns the results of the pruning settings as a table."""
+    lines = ["%8s %6s %6s %10s %10s %8s %8s %7s %7s %7s" % ("min_cmn", "max_n", "links", "cands/doc", "votes/doc",
+                                                             "time(s)", "docs/s", "Prec", "Rec", "F1")]
+    for r in rows:
+        lines.append("%8g %6d %6d %10.1f %10.1f %8.3f %8.1f %7.4f %7.4f %7.4f" % (
+            r["min_commonness"], r["max_candidates"], r["min_link_count"], r["candidates"], r["votes"], r["time"],
+            r["docs_per_sec"], r["prec"], r["rec"], r["f"]))
+    return "\n".join(lines)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Effect of candidate pruning on speed and F1")
+    parser.add_argument("docs_file", nargs="?", default=SNIPPETS, help="documents file (docID<TAB>text)")
+    parser.add_argument("qrel_file", nargs="?", default=DATA_DIR + "/qrels.txt")
+    parser.add_argument("-m", "--method", choices=["cmn", "tagme"], default="tagme")
+    parser.add_argument("--min-cmn", default="0,0.001,0.01,0.05", help="minimum commonness values")
+    parser.add_argument("--max-cands", default="0", help="max number of candidates per mention (0: no limit)")
+    parser.add_argument("--min-links", default="0", help="minimum mention link counts")
+    parser.add_argument("-t", "--score-threshold", type=float, default=0, help="score threshold of the evaluation")
+    args = parser.parse_args(args)
+
+    docs = sorted(Document.load_test_snippets(args.docs_file).items(), key=lambda item: int(item[0]))
+    qrels = parse_file(args.qrel_file)[0]
+    settings = product([float(x) for x in args.min_cmn.split(",")], [int(x) for x in args.max_cands.split(",")],
+                       [int(x) for x in args.min_links.split(",")])
+    rows = [evaluate_setting(args.method, docs, qrels, args.score_threshold, *setting) for setting in settings]
+    print(format_report(rows))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
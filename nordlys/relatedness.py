@@ -0,0 +1,246 @@
+"""
+Batched WLM relatedness and TAGME voting.
+
+Entities are referred to by their IDs in the entity vocabulary (see nordlys.entity_vocab), which the commonness
+index and the inlinks store share. The WLM relatedness of the candidate entities of a document is computed once
+from the inlinks store, for the entity pairs with common inlinks only (relatedness is 0 for all other pairs); these
+pairs are kept as a sparse list, and the voting scores of all mentions are accumulated from it with vectorized
+operations. Memory use thus grows with the number of related pairs rather than with the square of the number of
+candidate entities.
+"""
+
+from __future__ import division
+import json
+
+import numpy
+
+from nordlys.config import ENTITY_COUNT
+from nordlys.lru_cache import LRUCache
+
+
+class RelatednessCache(LRUCache):
+    """LRU cache of WLM relatedness scores, keyed by (unordered) pairs of entity IDs.
+    Only pairs with common inlinks are cached; relatedness is trivially 0 for all other pairs.
+    """
+
+    def __init__(self, max_size):
+        LRUCache.__init__(self, max_size)
+        self.new_entries = None  # entries added since the last pop_new_entries() call (if they are tracked)
+
+    def track_new_entries(self):
+        """Starts keeping track of the added entries (e.g., so that a worker process can pass them to its parent)."""
+        self.new_entries = []
+
+    def pop_new_entries(self):
+        """Returns the entries added since the last call [(key, rel), ...], and forgets them."""
+        entries = self.new_entries or []
+        if self.new_entries is not None:
+            self.new_entries = []
+        return entries
+
+    def put(self, key, value):
+        LRUCache.put(self, key, value)
+        if self.new_entries is not None:
+            self.new_entries.append((key, value))
+
+    @staticmethod
+    def get_key(e1, e2):
+        """Returns the cache key of an entity pair (independent of the order of the entities)."""
+        return (e1, e2) if e1 <= e2 else (e2, e1)
+
+    def save(self, cache_file, inlinks_store, max_entries=None):
+        """Writes the (max_entries most recently used) cached scores to a file.
+
+        Format: a header line with the fingerprint of the inlinks statistics, followed by `entity1 entity2 score`
+        lines. Entities are written as URIs, thus the file remains valid if the store is rebuilt from the
+        same statistics.
+        """
+        entries = self.items()
+        if max_entries is not None:
+            entries = entries[-max_entries:] if max_entries > 0 else []
+        with open(cache_file, "w") as f:
+            f.write("#" + json.dumps(inlinks_store.meta["source"]) + "\n")
+            for (e1, e2), rel in entries:
+                f.write(inlinks_store.get_entity(e1) + "\t" + inlinks_store.get_entity(e2) + "\t" + repr(rel) + "\n")
+
+    def load(self, cache_file, inlinks_store):
+        """Loads scores written by save(). Nothing is loaded if the inlinks statistics have changed since.
+
+        :return: True if the scores have been loaded
+        """
+        with open(cache_file, "r") as f:
+            if json.loads(f.readline()[1:]) != inlinks_store.meta["source"]:
+                return False
+            for line in f:
+                e1, e2, rel = line.rstrip("\n").split("\t")
+                e1, e2 = inlinks_store.get_entity_id(e1), inlinks_store.get_entity_id(e2)
+                if e1 != -1 and e2 != -1:
+                    self.put(self.get_key(e1, e2), float(rel))
+        return True
+
+
+class RelatednessEngine(object):
+
+    def __init__(self, inlinks_store, entity_count=ENTITY_COUNT, cache=None):
+        """
+        :param inlinks_store: entity inlinks statistics (InlinksStore)
+        :param entity_count: total number of entities in the KB
+        :param cache: relatedness cache shared across documents (RelatednessCache), optional
+        """
+        self.inlinks = inlinks_store
+        self.cache = cache
+        # work done so far (for profiling)
+        self.num_entities = 0  # candidate entities (counted once per document)
+        self.num_pairs = 0  # entity pairs with non-zero relatedness
+        self.num_computed = 0  # relatedness scores computed (i.e., not found in the cache)
+        self.log_entity_count = numpy.log(entity_count)
+
+    @staticmethod
+    def get_entity_ids(candidates):
+        """Returns the distinct candidate entities of a document (sorted entity IDs), and the position of the entity
+        of each candidate among them.
+
+        :param candidates: candidate entities (Candidates)
+        :return: list of entity IDs and the position of the entity of each candidate (array)
+        """
+        entity_ids, cols = numpy.unique(candidates.entity_ids, return_inverse=True)
+        return entity_ids.tolist(), cols
+
+    def wlm_pairs(self, entity_lists):
+        """Computes the WLM relatedness of several lists of entities (e.g., of a batch of documents) at once.
+        Relatedness is only non-zero for the entity pairs with common inlinks, thus only these pairs are computed
+        and they are returned as a sparse (COO) list. The relatedness of all pairs is computed in a single vectorized
+        pass, once per distinct pair.
+
+        :param entity_lists: list of lists of distinct entity IDs (see nordlys.entity_vocab)
+        :return: list of (rows, cols, rel) arrays, one for each list of entities: positions i <= j of the entities
+            of each pair in the list and their relatedness (relatedness is symmetric)
+        """
+        if len(entity_lists) == 0:
+            return []
+        # the rows of the pairs table needed by the whole batch are fetched at once (if the store reads them lazily)
+        self.inlinks.load_rows([e for ids in entity_lists for e in ids])
+        doc_pairs = []
+        for ids in entity_lists:
+            rows, cols, common = self.inlinks.common_inlinks_pairs(ids)
+            self.num_entities += len(ids)
+            self.num_pairs += len(rows)
+            doc_pairs.append((rows, cols, common))
+
+        # distinct pairs of the batch, as integer keys id1 * n + id2 (with id1 <= id2)
+        n = len(self.inlinks.inlinks)
+        keys = []
+        for ids, (rows, cols, _) in zip(entity_lists, doc_pairs):
+            ids = numpy.asarray(ids, dtype=numpy.int64)
+            ids1, ids2 = ids[rows], ids[cols]
+            keys.append(numpy.minimum(ids1, ids2) * n + numpy.maximum(ids1, ids2))
+        keys = numpy.concatenate(keys)
+        unique_keys, first, inverse = numpy.unique(keys, return_index=True, return_inverse=True)
+        common = numpy.concatenate([common for _, _, common in doc_pairs])[first]
+        rel = self.get_relatedness([(k // n, k % n) for k in unique_keys.tolist()], common.astype(numpy.float64))
+
+        wlms = []
+        end = 0
+        for rows, cols, _ in doc_pairs:
+            start, end = end, end + len(rows)
+            wlms.append((rows, cols, rel[inverse[start:end]]))
+        return wlms
+
+    def get_relatedness(self, keys, common):
+        """Computes the WLM relatedness of entity pairs with common inlinks (using the cache, if any).
+
+        :param keys: list of entity ID pairs (see RelatednessCache.get_key())
+        :param common: array of the number of common inlinks of the pairs
+        :return: array of relatedness scores
+        """
+        rel = numpy.zeros(len(keys))
+        missing = numpy.arange(len(keys))
+        if self.cache is not None:
+            cached = [self.cache.get(key) for key in keys]
+            missing = numpy.array([k for k, r in enumerate(cached) if r is None], dtype=numpy.int64)
+            for k, r in enumerate(cached):
+                if r is not None:
+                    rel[k] = r
+
+        if len(missing) > 0:
+            self.num_computed += len(missing)
+            ids1 = [keys[k][0] for k in missing.tolist()]
+            ids2 = [keys[k][1] for k in missing.tolist()]
+            in1 = numpy.array([self.inlinks.get_inlinks(i) for i in ids1], dtype=numpy.float64)
+            in2 = numpy.array([self.inlinks.get_inlinks(i) for i in ids2], dtype=numpy.float64)
+            numerator = numpy.log(numpy.maximum(in1, in2)) - numpy.log(common[missing])
+            denominator = self.log_entity_count - numpy.log(numpy.minimum(in1, in2))
+            rel[missing] = 1.0 - (numerator / denominator)
+            if self.cache is not None:
+                for k, r in zip(missing.tolist(), rel[missing].tolist()):
+                    self.cache.put(keys[k], r)
+        return rel
+
+    def vote_scores(self, candidates):
+        """Computes the voting-based score of all candidate entities for all mentions.
+
+        score(m,e) = \sum_{m' \in  M_d\{m} } \sum_{e' \in E_m'} vote(m',e)
+                   = \sum_{m' \in  M_d\{m} } \sum_{e' \in E_m'} WLM(e,e') P(e'|m')
+
+        :param candidates: candidate entities (Candidates)
+        :return: scores of the candidates (array, parallel to candidates.entity_ids)
+        """
+        return self.vote_scores_batch([candidates])[0]
+
+    def vote_scores_batch(self, candidates_list):
+        """Computes the voting-based scores of a batch of documents, sharing the relatedness computations
+        (see wlm_pairs()). The scores of each document are the same as those computed by vote_scores().
+
+        :param candidates_list: list of candidate entities (Candidates)
+        :return: list of scores of the candidates (arrays)
+        """
+        entity_maps = [self.get_entity_ids(candidates) for candidates in candidates_list]
+        wlms = self.wlm_pairs([entity_ids for entity_ids, _ in entity_maps])
+        return [self.__vote_scores(candidates, len(entity_ids), cols, wlm)
+                for candidates, (entity_ids, cols), wlm in zip(candidates_list, entity_maps, wlms)]
+
+    @staticmethod
+    def __vote_scores(candidates, num_entities, cols, wlm):
+        """Computes the voting-based scores of a document from the relatedness of its entity pairs (see wlm_pairs()).
+
+        :param num_entities: number of distinct candidate entities
+        :param cols: position of the entity of each candidate among the distinct entities
+        :param wlm: entity pairs with non-zero relatedness (rows, cols, rel)
+        """
+        if len(cols) == 0:
+            return numpy.zeros(0)
+        mention_rows = candidates.get_mention_rows()
+        # weight of each candidate: its commonness, summed over repeated occurrences of the mention
+        weights = candidates.cmn * numpy.array(candidates.counts, dtype=numpy.float64)[mention_rows]
+
+        # relatedness as directed pairs (e, e'); the pair of an entity with itself is taken once
+        rows_p, cols_p, rel = wlm
+        off = rows_p != cols_p
+        src = numpy.concatenate([rows_p, cols_p[off]])
+        dst = numpy.concatenate([cols_p, rows_p[off]])
+        rel = numpy.concatenate([rel, rel[off]])
+
+        # total votes of each entity e (over all mentions): \sum_{e'} WLM(e,e') \sum_{m} P(e'|m)
+        entity_weights = numpy.bincount(cols, weights=weights, minlength=num_entities)
+        total = numpy.bincount(src, weights=rel * entity_weights[dst], minlength=num_entities)
+
+        # own votes of each candidate (m, e): \sum_{e' \in E_m} WLM(e,e') P(e'|m); each directed pair (e, e') is joined
+        # with the candidates (m, e') of e', which vote for the candidate (m, e) if it exists
+        by_entity = numpy.argsort(cols, kind="mergesort")
+        entity_counts = numpy.bincount(cols, minlength=num_entities)
+        entity_starts = numpy.cumsum(entity_counts) - entity_counts
+        n = entity_counts[dst]
+        pair = numpy.repeat(numpy.arange(len(dst)), n)
+        voters = by_entity[entity_starts[dst][pair] + numpy.arange(n.sum()) - numpy.repeat(numpy.cumsum(n) - n, n)]
+        cand_keys = mention_rows * num_entities + cols
+        key_order = numpy.argsort(cand_keys)
+        sorted_keys = cand_keys[key_order]
+        target_keys = mention_rows[voters] * num_entities + src[pair]
+        pos = numpy.minimum(numpy.searchsorted(sorted_keys, target_keys), len(sorted_keys) - 1)
+        match = sorted_keys[pos] == target_keys
+        own = numpy.bincount(key_order[pos[match]], weights=(rel[pair] * weights[voters])[match],
+                             minlength=len(cols))
+
+        # each mention gets the votes of all the other mentions: the total votes of each entity minus the mention's
+        # own votes
+        return total[cols] - own
@@ -0,0 +1,355 @@
+"""
+Entity linking HTTP service.
+
+The statistics are loaded once, when the server is started; documents are then annotated on request:
+
+    GET  /health     -> {"status": "ok", "method": "tagme"}
+    POST /annotate   {"id": "1", "text": "..."}
+                     -> {"id": "1", "annotations": [{"mention": "stop motion", "entity": "<wikipedia:Stop_motion>",
+                                                     "score": 0.95, "offsets": [[30, 41]]}, ...]}
+
+A batch of documents can be posted as a JSON list, and a list of results is returned in the same order.
+Offsets are the [start, end) character positions of the occurrences of the mention in the text.
+
+Requests are handled by threads; as annotation is CPU-bound, the linker is used by one thread at a time. With
+micro-batching (-w), the documents of concurrent requests arriving within a time window are annotated together
+(see nordlys.micro_batcher). To use several CPUs, the server can be forked into multiple processes (-p) that
+accept connections on the same socket and share the memory-mapped statistics. Annotations of repeated documents
+(e.g., retried requests) are served from a cache, which can be persisted in a database (--cache-file). TAGME's
+relatedness cache is disabled by default (--relatedness-cache-size); with --relatedness-cache, it is loaded from a
+file at start-up and saved to it by the main process when the server is stopped (merged with the entries of the
+other processes), so that a restarted server starts warm.
+
+A load test client measures the throughput and latency of a running server, using the documents of a file with
+one `docID<TAB>text` document per line:
+
+Usage: python -m nordlys.server serve [-p num_processes] [-w batch_window_ms] [--host host] [--port port] <cmn|tagme>
+       python -m nordlys.server bench [-c concurrency] [-n num_requests] [-b batch_size] <url> <docs_file>
+"""
+
+from __future__ import division
+import argparse
+import BaseHTTPServer
+import cPickle
+import httplib
+import json
+import os
+import signal
+import SocketServer
+import sys
+import threading
+import time
+import traceback
+import urlparse
+
+import numpy
+
+from nordlys.config import RELATEDNESS_CACHE_SIZE
+from nordlys.document import Document
+from nordlys.el_cmn_sol import ELCmn
+from nordlys.el_tagme_sol import ELTagme
+from nordlys.micro_batcher import MicroBatcher
+from nordlys.spotter import MentionSpotter
+
+LINKERS = {"cmn": ELCmn, "tagme": ELTagme}
+
+
+class AnnotationHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # persistent connections
+
+    def send_json(self, code, obj):
+        """Sends a JSON response."""
+        body = json.dumps(obj)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok", "method": self.server.method})
+        else:
+            self.send_json(404, {"error": "not found: " + self.path})
+
+    def do_POST(self):
+        if self.path != "/annotate":
+            self.send_json(404, {"error": "not found: " + self.path})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.getheader("Content-Length", 0))))
+            if isinstance(request, list):
+                response = self.server.annotate_many(request)
+            else:
+                response = self.server.annotate(request)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.send_json(400, {"error": "invalid request: " + str(e)})
+            return
+        except Exception as e:
+            sys.stderr.write(traceback.format_exc())
+            self.send_json(500, {"error": "internal error: " + str(e)})
+            return
+        self.send_json(200, response)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class AnnotationServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, linker, method, verbose=False, batcher=None):
+        """
+        :param address: (host, port) the server listens on
+        :param linker: entity linker (ELCmn or ELTagme instance)
+        :param method: name of the linking method (reported by /health)
+        :param batcher: micro-batcher of the linker, returning the offsets of the mentions (MicroBatcher), optional
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, address, AnnotationHandler)
+        self.linker = linker
+        self.method = method
+        self.verbose = verbose
+        self.batcher = batcher
+        self.lock = threading.Lock()  # the linkers (and their caches) are not thread-safe
+
+    def annotate(self, doc):
+        """Annotates a document {"id": doc_id, "text": text}.
+
+        :return: {"id": doc_id, "annotations": [{"mention": men, "entity": en, "score": score, "offsets": [...]}]}
+        """
+        return self.annotate_many([doc])[0]
+
+    def annotate_many(self, docs):
+        """Annotates a list of documents (see annotate()). With micro-batching, all documents are submitted before
+        waiting for the results, thus they can be annotated in the same batch.
+        """
+        docs = [self.__parse(doc) for doc in docs]
+        if self.batcher is not None:
+            futures = [self.batcher.submit(text, doc_id) for doc_id, text in docs]
+            results = [future.result() for future in futures]
+        else:
+            with self.lock:
+                results = [self.linker.annotate_with_offsets(text, doc_id) for doc_id, text in docs]
+        return [self.__format(doc_id, linked_ens, self.__get_char_offsets(text, offsets))
+                for (doc_id, text), (linked_ens, offsets) in zip(docs, results)]
+
+    @staticmethod
+    def __parse(doc):
+        """Returns the ID and the (utf-8 encoded) text of a requested document."""
+        doc_id, text = doc.get("id", ""), doc["text"]
+        if not isinstance(text, basestring):
+            raise TypeError("text must be a string")
+        if isinstance(text, unicode):
+            text = text.encode("utf-8")
+        return doc_id, text
+
+    @staticmethod
+    def __get_char_offsets(text, offsets):
+        """Converts the offsets of the mentions in the utf-8 encoded text to character positions.
+
+        :param text: utf-8 encoded text
+        :param offsets: byte offsets {men: [(start, end), ...], ...}
+        :return: character offsets {men: [(start, end), ...], ...}
+        """
+        data = numpy.frombuffer(text, dtype=numpy.uint8) if len(text) > 0 else numpy.zeros(0, dtype=numpy.uint8)
+        if not numpy.any(data & 0x80):
+            return offsets  # ASCII text
+        # chars[i]: number of characters in the first i bytes (continuation bytes are 10xxxxxx)
+        chars = numpy.concatenate([[0], numpy.cumsum((data & 0xC0) != 0x80)])
+        return {men: [(int(chars[start]), int(chars[end])) for start, end in men_offsets]
+                for men, men_offsets in offsets.iteritems()}
+
+    @staticmethod
+    def __format(doc_id, linked_ens, offsets):
+        """Returns the annotations of a document in the response format (see annotate())."""
+        annotations = [{"mention": men, "entity": en, "score": score, "offsets": [list(o) for o in offsets[men]]}
+                       for men, (en, score) in linked_ens.iteritems()]
+        annotations.sort(key=lambda annot: annot["offsets"][0])
+        return {"id": doc_id, "annotations": annotations}
+
+
+def serve(server, num_processes=1):
+    """Runs the server in num_processes processes (forked from the current one) until interrupted.
+
+    If the relatedness cache of the linker is saved, the forked processes pass their entries to the main process
+    when they are stopped, which merges them into its cache before saving it.
+    """
+    save_relatedness = getattr(server.linker, "relatedness_cache_file", None) is not None
+    children = []
+    for _ in range(num_processes - 1):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read_fd)
+                # the main process stops the other processes (with SIGTERM), so that they can pass their entries
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+                # threads are not inherited by forked processes, thus each process starts its own batcher
+                if server.batcher is not None:
+                    server.batcher.start()
+                server.serve_forever()
+            finally:
+                if save_relatedness:
+                    _send_relatedness_cache(server, write_fd)
+                os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+    try:
+        if server.batcher is not None:
+            server.batcher.start()
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid, _ in children:
+            os.kill(pid, signal.SIGTERM)
+        entries = []
+        for pid, read_fd in children:
+            with os.fdopen(read_fd, "rb") as f:
+                if save_relatedness:
+                    try:
+                        entries.extend(cPickle.load(f))
+                    except EOFError:  # the process was killed before passing its entries
+                        pass
+            os.waitpid(pid, 0)
+        server.server_close()
+        if save_relatedness:
+            if server.batcher is not None:
+                server.batcher.stop()
+            with server.lock:
+                # the entries of the main process are put last, as the most recently used ones
+                entries.extend(server.linker.relatedness_cache.items())
+                for key, rel in entries:
+                    server.linker.relatedness_cache.put(key, rel)
+                server.linker.save_relatedness_cache()
+
+
+def _send_relatedness_cache(server, write_fd):
+    """Passes the entries of the relatedness cache of a forked server process to the main process."""
+    try:
+        if server.batcher is not None:
+            server.batcher.stop()
+        with server.lock:
+            entries = server.linker.relatedness_cache.items()
+        with os.fdopen(write_fd, "wb") as f:
+            cPickle.dump(entries, f, cPickle.HIGHEST_PROTOCOL)
+    except Exception:
+        sys.stderr.write(traceback.format_exc())
+
+
+class LoadClient(object):
+    """Load test client: sends annotation requests to a server from concurrent threads."""
+
+    def __init__(self, url, concurrency=1, batch_size=1):
+        """
+        :param url: base URL of the server (e.g., http://localhost:8080)
+        :param concurrency: number of concurrent connections
+        :param batch_size: number of documents per request
+        """
+        parsed = urlparse.urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+
+    def get_requests(self, docs, num_requests):
+        """Returns the request bodies, cycling through the documents [(doc_id, doc), ...]."""
+        requests = []
+        for i in range(num_requests):
+            batch = [docs[(i * self.batch_size + j) % len(docs)] for j in range(self.batch_size)]
+            body = [{"id": doc_id, "text": doc} for doc_id, doc in batch]
+            requests.append(json.dumps(body if self.batch_size > 1 else body[0]))
+        return requests
+
+    def __send(self, requests, latencies, errors):
+        """Sends requests over a persistent connection and records their latencies."""
+        conn = httplib.HTTPConnection(self.host, self.port)
+        try:
+            for body in requests:
+                start = time.time()
+                conn.request("POST", "/annotate", body, {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                latencies.append(time.time() - start)
+                if response.status != 200:
+                    errors.append(response.status)
+        finally:
+            conn.close()
+
+    def run(self, docs, num_requests):
+        """Sends num_requests requests and measures throughput and latency.
+
+        :return: dictionary of results
+        """
+        requests = self.get_requests(docs, num_requests)
+        latencies, errors = [], []
+        threads = [threading.Thread(target=self.__send, args=(requests[i::self.concurrency], latencies, errors))
+                   for i in range(self.concurrency)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        total_time = time.time() - start
+
+        latencies_ms = 1000 * numpy.array(latencies)
+        return {"requests": len(latencies), "errors": len(errors), "concurrency": self.concurrency,
+                "batch_size": self.batch_size, "total_time": total_time,
+                "requests_per_sec": len(latencies) / total_time,
+                "docs_per_sec": len(latencies) * self.batch_size / total_time,
+                "latency_mean": float(latencies_ms.mean()),
+                "latency_p50": float(numpy.percentile(latencies_ms, 50)),
+                "latency_p90": float(numpy.percentile(latencies_ms, 90)),
+                "latency_p99": float(numpy.percentile(latencies_ms, 99)),
+                "latency_max": float(latencies_ms.max())}
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Entity linking service")
+    subparsers = parser.add_subparsers(dest="command")
+    serve_parser = subparsers.add_parser("serve", help="runs the server")
+    serve_parser.add_argument("method", choices=sorted(LINKERS.keys()), help="entity linking method")
+    serve_parser.add_argument("--host", default="localhost")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("-p", "--processes", type=int, default=1, help="number of server processes")
+    serve_parser.add_argument("-w", "--batch-window", type=float, default=0,
+                              help="micro-batching window in ms (default: 0, no micro-batching)")
+    serve_parser.add_argument("--max-batch", type=int, default=32, help="max number of documents per micro-batch")
+    serve_parser.add_argument("--resolve", choices=[MentionSpotter.LONGEST, MentionSpotter.LINKS], default=None,
+                              help="overlapping mention resolution strategy (default: all mentions are used)")
+    serve_parser.add_argument("--cache-file", default=None, help="sqlite database annotations are cached in")
+    serve_parser.add_argument("--relatedness-cache", default=None,
+                              help="file the relatedness cache is loaded from and saved to on shutdown (tagme)")
+    serve_parser.add_argument("--relatedness-cache-size", type=int, default=RELATEDNESS_CACHE_SIZE,
+                              help="max number of entity pairs in the relatedness cache (tagme, default: 0, disabled)")
+    serve_parser.add_argument("-v", "--verbose", action="store_true", help="logs the requests")
+    bench_parser = subparsers.add_parser("bench", help="load test of a running server")
+    bench_parser.add_argument("url", help="server URL, e.g., http://localhost:8080")
+    bench_parser.add_argument("docs_file", help="documents file (docID<TAB>text)")
+    bench_parser.add_argument("-c", "--concurrency", type=int, default=4, help="number of concurrent connections")
+    bench_parser.add_argument("-n", "--requests", type=int, default=1000, help="number of requests")
+    bench_parser.add_argument("-b", "--batch-size", type=int, default=1, help="documents per request")
+    args = parser.parse_args(args)
+
+    if args.command == "serve":
+        if args.relatedness_cache is not None and args.relatedness_cache_size <= 0:
+            serve_parser.error("--relatedness-cache needs a relatedness cache (--relatedness-cache-size)")
+        options = {"relatedness_cache_file": args.relatedness_cache,
+                   "relatedness_cache_size": args.relatedness_cache_size} if args.method == "tagme" else {}
+        linker = LINKERS[args.method](mention_resolution=args.resolve, annotation_cache_file=args.cache_file,
+                                      **options)
+        batcher = None
+        if args.batch_window > 0:
+            batcher = MicroBatcher(linker, args.max_batch, args.batch_window / 1000, offsets=True)
+        server = AnnotationServer((args.host, args.port), linker, args.method, args.verbose, batcher)
+        sys.stderr.write("serving " + args.method + " on http://" + args.host + ":" + str(args.port) + "\n")
+        serve(server, args.processes)
+    else:
+        docs = sorted(Document.load_test_snippets(args.docs_file).items())
+        client = LoadClient(args.url, args.concurrency, args.batch_size)
+        print(json.dumps(client.run(docs, args.requests), indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
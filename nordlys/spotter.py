@@ -0,0 +1,117 @@
+"""
+Mention detection over the commonness index.
+
+The sorted mention table of the index is used as an implicit token-level trie: starting from each token,
+the range of mentions sharing the current token prefix is narrowed down (by binary search) as long as it
+is non-empty. This way only the n-grams that are prefixes of known mentions are ever built, instead of
+all O(n^2) n-grams of the document.
+
+All spotted mentions may overlap each other (e.g., "stop motion animation", "stop motion", "animation").
+Optionally, a set of non-overlapping mentions can be selected (see MentionSpotter.resolve_overlaps()), among the
+mentions that are not pruned (see MentionSpotter.filter_spans()).
+"""
+
+from collections import defaultdict, namedtuple
+
+# token offsets (end is exclusive), the mention and its ID in the commonness index
+Span = namedtuple("Span", ["start", "end", "mention", "mention_id"])
+
+
+class MentionSpotter(object):
+
+    # overlapping mention resolution strategies
+    LONGEST = "longest"  # longest mentions first
+    LINKS = "links"  # most frequently linked mentions first
+
+    def __init__(self, cmn_index):
+        self.cmn_index = cmn_index
+        self.mentions = cmn_index.mentions
+        self.num_lookups = 0  # number of n-grams looked up so far (for profiling)
+
+    def spot(self, tokens):
+        """Finds all mentions in a list of tokens.
+
+        :param tokens: list of (lowercased) tokens
+        :return: list of spans [Span(start, end, mention, mention_id), ...], ordered by start and end offsets
+        """
+        spans = []
+        for start in range(len(tokens)):
+            prefix = tokens[start]
+            lo, hi = self.mentions.prefix_range(prefix)
+            self.num_lookups += 1
+            end = start + 1
+            while lo < hi:
+                if self.mentions[lo] == prefix:
+                    spans.append(Span(start, end, prefix, lo))
+                if end == len(tokens):
+                    break
+                # narrow down to the mentions continuing with the next token
+                prefix += " " + tokens[end]
+                lo, hi = self.mentions.prefix_range(prefix, lo, hi)
+                self.num_lookups += 1
+                end += 1
+        return spans
+
+    def filter_spans(self, spans, min_link_count=0, min_commonness=0, max_candidates=0):
+        """Keeps the spans of the mentions that are not pruned: mentions linked at least min_link_count times and
+        having candidate entities left after pruning (see CmnIndex.get_candidate_ids()). Overlaps are to be resolved
+        among these spans, so that a pruned mention does not shadow the (valid) mentions it overlaps.
+
+        :param spans: list of spans (see spot())
+        :return: list of spans, in the same order
+        """
+        valid = {}
+        for span in spans:
+            if span.mention_id not in valid:
+                if min_link_count > 0 and self.cmn_index.get_mention_links(span.mention_id) < min_link_count:
+                    valid[span.mention_id] = False
+                else:
+                    entity_ids, _ = self.cmn_index.get_candidate_ids(span.mention_id, min_commonness, max_candidates)
+                    valid[span.mention_id] = len(entity_ids) > 0
+        return [span for span in spans if valid[span.mention_id]]
+
+    def resolve_overlaps(self, spans, strategy=LONGEST):
+        """Selects non-overlapping spans greedily, by decreasing priority: span length ("longest") or the number of
+        times the mention is linked ("links"). Remaining ties are broken by the other criterion, then by position.
+
+        :param spans: list of spans (see spot())
+        :param strategy: MentionSpotter.LONGEST or MentionSpotter.LINKS
+        :return: list of non-overlapping spans, ordered by start offset
+        """
+        link_counts = {}
+        for span in spans:
+            if span.mention not in link_counts:
+                link_counts[span.mention] = self.cmn_index.get_mention_links(span.mention_id)
+        if strategy == self.LONGEST:
+            priority = lambda s: (-(s.end - s.start), -link_counts[s.mention], s.start)
+        elif strategy == self.LINKS:
+            priority = lambda s: (-link_counts[s.mention], -(s.end - s.start), s.start)
+        else:
+            raise ValueError("unknown mention resolution strategy: " + str(strategy))
+
+        covered = set()
+        selected = []
+        for span in sorted(spans, key=priority):
+            positions = range(span.start, span.end)
+            if not covered.intersection(positions):
+                covered.update(positions)
+                selected.append(span)
+        return sorted(selected)
+
+    @staticmethod
+    def get_offsets(spans, mentions=None, document=None):
+        """Returns the offsets of the occurrences of the mentions.
+
+        :param spans: list of spans (see spot())
+        :param mentions: mentions to consider (all mentions if None)
+        :param document: if given, character offsets in the original document are returned instead of token offsets
+        :return: {men: [(start, end), ...], ...}
+        """
+        offsets = defaultdict(list)
+        for span in spans:
+            if mentions is None or span.mention in mentions:
+                if document is not None:
+                    offsets[span.mention].append(document.get_char_span(span.start, span.end))
+                else:
+                    offsets[span.mention].append((span.start, span.end))
+        return offsets
@@ -0,0 +1,93 @@
+"""
+Parameter sweep of TAGME's k_th parameter and of the score threshold.
+
+Only the selection of entities depends on k_th, thus the statistics are loaded and the voting-based scores of each
+document are computed once; the entities are then selected for each k_th value (see ELTagme.annotate_sweep()).
+The results of each setting are written to a separate file, output_tagme_k<k_th>_t<threshold>.txt, in the output
+directory (annotations with a score below the threshold are left out). If a qrels file is given, the precision,
+recall and F1 of all settings are reported (see nordlys.evaluator_annot).
+
+Values are given either as comma separated values ("0.1,0.3") or as a start:stop:step grid ("0.1:0.5:0.1").
+
+Usage: python -m nordlys.tagme_sweep [-k k_values] [-t thresholds] [-o output_dir] [-q qrel_file] [docs_file]
+"""
+
+import argparse
+import os
+import sys
+
+from nordlys.config import SNIPPETS, OUTPUT_DIR
+from nordlys.document import Document
+from nordlys.el_tagme_sol import ELTagme
+from nordlys.el_utils import ELUtils
+from nordlys.evaluator_annot import EvaluatorSweep, parse_file, parse_thresholds
+
+
+def get_output_file(output_dir, k_th, score_th):
+    """Returns the name of the results file of a setting."""
+    return output_dir + "/output_tagme_k" + str(k_th) + "_t" + str(score_th) + ".txt"
+
+
+def sweep(linker, docs, k_values, thresholds, output_dir, collect_results=False):
+    """Annotates the documents with all settings and writes the results of each setting to a file.
+
+    :param linker: ELTagme instance
+    :param docs: documents (iterable of (doc_id, doc) pairs)
+    :param k_values: list of k_th values
+    :param thresholds: list of score thresholds
+    :param output_dir: directory of the results files
+    :param collect_results: if True, the results are also kept in memory (for evaluation)
+    :return: results of each k_th value (without threshold), as lists of columns {k_th: [[qid, score, ...], ...]},
+        or None if they are not collected
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    out_files = {(k_th, th): open(get_output_file(output_dir, k_th, th), "w") for k_th in k_values for th in thresholds}
+    results = {k_th: [] for k_th in k_values} if collect_results else None
+    for doc_id, doc in docs:
+        for k_th, linked_ens in zip(k_values, linker.annotate_sweep(doc, doc_id, k_values)):
+            for th in thresholds:
+                out_files[(k_th, th)].write(ELUtils.format_annotations(doc_id, linked_ens, score_th=th))
+            if collect_results:
+                results[k_th] += [line.split("\t")
+                                  for line in ELUtils.format_annotations(doc_id, linked_ens).splitlines()]
+    for out_file in out_files.itervalues():
+        out_file.close()
+    return results
+
+
+def format_report(rows):
+    """Returns the metrics of all settings as a table, followed by the best setting."""
+    lines = ["k_th\tThreshold\tPrec\tRec\tF1"]
+    for k_th, m in rows:
+        lines.append(str(k_th) + "\t" + str(m['th']) + "\t" + str(round(m['prec'], 4)) + "\t" +
+                     str(round(m['rec'], 4)) + "\t" + str(round(m['f'], 4)))
+    best_k, best = max(rows, key=lambda row: (row[1]['f'], -rows.index(row)))
+    lines.append("Best F1: " + str(round(best['f'], 4)) + " (k_th " + str(best_k) + ", threshold " +
+                 str(best['th']) + ")")
+    return "\n".join(lines)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Parameter sweep of TAGME's k_th and the score threshold")
+    parser.add_argument("docs_file", nargs="?", default=SNIPPETS, help="documents file (docID<TAB>text)")
+    parser.add_argument("-k", "--k-values", default="0.1:0.5:0.1", help="k_th values")
+    parser.add_argument("-t", "--thresholds", default="0", help="score thresholds")
+    parser.add_argument("-o", "--output-dir", default=OUTPUT_DIR + "/sweep", help="directory of the results files")
+    parser.add_argument("-q", "--qrels", default=None, help="qrels file; the settings are evaluated if given")
+    args = parser.parse_args(args)
+
+    k_values, thresholds = parse_thresholds(args.k_values), parse_thresholds(args.thresholds)
+    with open(args.docs_file, "r") as docs_file:
+        results = sweep(ELTagme(), Document.read_snippets(docs_file), k_values, thresholds, args.output_dir,
+                        collect_results=args.qrels is not None)
+    sys.stderr.write(str(len(k_values) * len(thresholds)) + " result files written to " + args.output_dir + "\n")
+
+    if args.qrels is not None:
+        qrels = parse_file(args.qrels)[0]
+        rows = [(k_th, m) for k_th in k_values for m in EvaluatorSweep(qrels, results[k_th]).eval(thresholds)]
+        print(format_report(rows))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
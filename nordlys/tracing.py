@@ -0,0 +1,174 @@
+"""
+Tracing of the entity linking process.
+
+The linkers are quiet by default. When a tracer is attached to a linker, it receives structured per-document
+events (dictionaries), e.g.:
+
+    {"doc_id": "1", "event": "mention_detection", "time": 0.0012, "mentions": 12, "candidates": 85}
+    {"doc_id": "1", "event": "top_k", "mention": "stop motion", "entities": ["<wikipedia:Stop_motion>"]}
+    {"doc_id": "1", "event": "disambiguation", "time": 0.0153, "votes": 6970, "linked": 12}
+    {"doc_id": "1", "event": "profile", "times": {"preprocess": 0.0001, ...}, "counts": {"tokens": 31, ...}}
+
+The profile event holds the wall time of each phase of the linking pipeline (preprocess, mention_detection,
+candidates, disambiguation/voting/selection) and the amount of work done (tokens, n-grams looked up, mentions,
+candidate entities, relatedness pairs and cache hits, ...), see Profile.
+
+Tracers:
+  - Tracer: delivers the events to a callback function
+  - JsonlTracer: writes the events to a file, one JSON object per line
+  - DebugTracer: prints the mention detection and disambiguation results in a human-readable form
+  - Profiler: aggregates the profiles of all documents into a summary report
+"""
+
+from __future__ import division
+from collections import OrderedDict, defaultdict
+import json
+import time
+
+from nordlys.el_utils import ELUtils
+
+
+class Profile(object):
+    """Wall time and work counts of the phases of annotating a single document."""
+
+    def __init__(self, doc_id):
+        self.doc_id = doc_id
+        self.times = OrderedDict()
+        self.counts = OrderedDict()
+        self.__last = time.time()
+
+    def lap(self, phase):
+        """Records the time elapsed since the previous lap (or since the profile was created) for a phase."""
+        now = time.time()
+        self.times[phase] = self.times.get(phase, 0) + now - self.__last
+        self.__last = now
+
+    def count(self, name, n):
+        """Adds n to a work counter."""
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def total(self, phases):
+        """Returns the total time of the given phases."""
+        return sum(self.times.get(phase, 0) for phase in phases)
+
+
+class Tracer(object):
+
+    def __init__(self, callback=None):
+        """
+        :param callback: function called with each event
+        """
+        self.callback = callback
+
+    def emit(self, event):
+        """Delivers an event."""
+        if self.callback is not None:
+            self.callback(event)
+
+    def mention_detection(self, doc_id, candidates, elapsed):
+        """Called after mention detection.
+
+        :param candidates: candidate entities (Candidates)
+        :param elapsed: time spent (in seconds)
+        """
+        self.emit({"doc_id": doc_id, "event": "mention_detection", "time": elapsed, "mentions": len(candidates),
+                   "candidates": candidates.num_candidates()})
+
+    def top_k(self, doc_id, mention, top_k_ens):
+        """Called with the top-k entities selected for a mention (TAGME)."""
+        self.emit({"doc_id": doc_id, "event": "top_k", "mention": mention, "entities": top_k_ens})
+
+    def disambiguation(self, doc_id, disamb_ens, elapsed, votes=0):
+        """Called after disambiguation.
+
+        :param disamb_ens: disambiguated entities {men:(en, score), ...}
+        :param elapsed: time spent (in seconds)
+        :param votes: number of vote(m',e) scores computed
+        """
+        self.emit({"doc_id": doc_id, "event": "disambiguation", "time": elapsed, "votes": votes,
+                   "linked": len(disamb_ens)})
+
+    def profile(self, profile):
+        """Called with the profile of a document, after it has been annotated."""
+        self.emit({"doc_id": profile.doc_id, "event": "profile", "times": profile.times, "counts": profile.counts})
+
+
+class JsonlTracer(Tracer):
+
+    def __init__(self, out_file):
+        """
+        :param out_file: name of the file events are appended to
+        """
+        super(JsonlTracer, self).__init__()
+        # each event is written with a single write call, so that processes sharing the file do not mix up lines
+        self.out_file = open(out_file, "a")
+
+    def emit(self, event):
+        self.out_file.write(json.dumps(event) + "\n")
+        self.out_file.flush()
+
+
+class DebugTracer(Tracer):
+
+    def mention_detection(self, doc_id, candidates, elapsed):
+        ELUtils.debug_mention_detection(candidates.to_dict())
+
+    def top_k(self, doc_id, mention, top_k_ens):
+        print("\t'" + mention + "' top-k: " + ", ".join(top_k_ens))
+
+    def disambiguation(self, doc_id, disamb_ens, elapsed, votes=0):
+        ELUtils.debug_disambiguation(disamb_ens)
+
+
+class Profiler(Tracer):
+    """Aggregates the per-document profiles into a summary.
+    All events can also be forwarded to another tracer (which must handle them in its emit() method).
+    """
+
+    def __init__(self, tracer=None):
+        super(Profiler, self).__init__()
+        self.tracer = tracer
+        self.num_docs = 0
+        self.times = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def emit(self, event):
+        if event["event"] == "profile":
+            self.merge({"docs": 1, "times": event["times"], "counts": event["counts"]})
+        if self.tracer is not None:
+            self.tracer.emit(event)
+
+    def merge(self, summary):
+        """Adds a summary (see get_summary()) to the aggregated values."""
+        self.num_docs += summary["docs"]
+        for phase, elapsed in summary["times"].iteritems():
+            self.times[phase] += elapsed
+        for name, n in summary["counts"].iteritems():
+            self.counts[name] += n
+
+    def get_summary(self, reset=False):
+        """Returns the aggregated values {"docs": n, "times": {phase: time, ...}, "counts": {name: n, ...}}.
+
+        :param reset: if True, the aggregated values are reset (e.g., after being sent to another process)
+        """
+        summary = {"docs": self.num_docs, "times": dict(self.times), "counts": dict(self.counts)}
+        if reset:
+            self.num_docs = 0
+            self.times.clear()
+            self.counts.clear()
+        return summary
+
+    def report(self):
+        """Returns the summary as a human-readable table."""
+        n = max(self.num_docs, 1)
+        total_time = sum(self.times.values())
+        lines = ["Documents: " + str(self.num_docs), "",
+                 "%-20s %12s %12s %8s" % ("Phase", "Total (s)", "Per doc (ms)", "%")]
+        for phase, elapsed in sorted(self.times.items(), key=lambda item: item[1], reverse=True):
+            lines.append("%-20s %12.3f %12.3f %8.1f" % (phase, elapsed, 1000 * elapsed / n,
+                                                        100 * elapsed / total_time if total_time else 0))
+        lines.append("%-20s %12.3f %12.3f %8.1f" % ("total", total_time, 1000 * total_time / n, 100))
+        lines += ["", "%-20s %12s %12s" % ("Counter", "Total", "Per doc")]
+        for name, cnt in sorted(self.counts.items()):
+            lines.append("%-20s %12d %12.1f" % (name, cnt, cnt / n))
+        return "\n".join(lines)
@@ -0,0 +1,92 @@
+"""
+Tests of the commonness index against the commonness dictionaries of the original linkers.
+
+Usage: python -m unittest discover tests
+"""
+from __future__ import division
+import csv
+import random
+import shutil
+import tempfile
+import unittest
+
+from nordlys.cmn_index import CmnIndex
+from nordlys.config import STATS_MENTION_ENTITY
+from nordlys.entity_vocab import EntityVocab
+
+
+def get_commonness(stats_file):
+    """Loads the commonness dictionaries {men: {en: cmn, ..., "_total": freq}, ...} as the original linkers did."""
+    commonness = dict()
+    with open(stats_file, 'rb') as tsvfile:
+        reader = csv.reader(tsvfile, delimiter='\t')
+        for row in reader:
+            mention, entity, freq = row[0], row[1], int(row[2])
+            if mention not in commonness:
+                commonness[mention] = dict()
+            commonness[mention][entity] = freq
+    for m in commonness.keys():
+        for e in commonness[m].keys():
+            norm = commonness[m].get("_total", 0)
+            if e != "_total" and norm != 0:
+                commonness[m][e] /= norm
+    return commonness
+
+
+def write_tied_stats(stats_file, rnd):
+    """Writes mention-entity statistics where most mentions have entities with the same commonness."""
+    entities = ["<wikipedia:Entity_%d>" % i for i in range(500)] + ["<wikipedia:entity_%d>" % i for i in range(50)]
+    with open(stats_file, "w") as f:
+        for m in range(1000):
+            rows = [(e, rnd.choice([1, 1, 2, 3])) for e in rnd.sample(entities, rnd.randint(1, 20))]
+            rows.insert(rnd.randint(0, len(rows)), ("_total", sum(freq for _, freq in rows) + rnd.choice([0, 1, 5])))
+            for e, freq in rows:
+                f.write("w%d\t%s\t%d\n" % (m, e, freq))
+
+
+class CmnIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def check(self, stats_file):
+        EntityVocab.build(stats_file, self.tmp_dir + "/entities")
+        vocab = EntityVocab(self.tmp_dir + "/entities")
+        CmnIndex.build(stats_file, self.tmp_dir + "/commonness", vocab)
+        index = CmnIndex(self.tmp_dir + "/commonness", vocab)
+
+        commonness = get_commonness(stats_file)
+        self.assertEqual(len(index), len(commonness))
+        for m, cmn in commonness.iteritems():
+            expected = {e: score for e, score in cmn.iteritems() if e != "_total"}
+            self.assertEqual(index.get(m), expected, m)
+            # candidates by decreasing commonness, ties in the iteration order of the original dictionary (the first
+            # such entity was selected by the linkers)
+            entity_ids = index.lookup(m)[0].tolist()
+            self.assertEqual([index.get_entity(e) for e in entity_ids],
+                             sorted([e for e in cmn if e != "_total"], key=lambda e: -cmn[e]), m)
+            self.assertEqual(index.get_mention_links(index.get_mention_id(m)), cmn.get("_total", 0), m)
+            # TAGME broke ties in the order of a {en: score} dictionary of the (pruned) candidates, filled in the
+            # iteration order of the original dictionary
+            for n in set([1, len(entity_ids) // 2, len(entity_ids)]):
+                score = dict()
+                for e in cmn:
+                    if e != "_total" and index.get_entity_id(e) in entity_ids[:n]:
+                        score[e] = 0
+                order = index.get_dict_order(index.get_mention_id(m), n)
+                self.assertEqual([index.get_entity(entity_ids[k]) for k in order], score.keys(), m)
+
+    def test_stats(self):
+        self.check(STATS_MENTION_ENTITY)
+
+    def test_ties(self):
+        stats_file = self.tmp_dir + "/mention_entity.tsv"
+        write_tied_stats(stats_file, random.Random(0))
+        self.check(stats_file)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+Tests of the single-pass tokenizer against the original pre-processing.
+
+Usage: python -m unittest discover tests
+"""
+
+import random
+import unittest
+
+from nordlys.document import Document
+
+# fragments random documents are built from: words, the OR/AND operators (in various cases and surroundings),
+# separators, and non-ASCII characters that lowercase to ASCII letters (KELVIN SIGN, LATIN CAPITAL LETTER I WITH DOT
+# ABOVE)
+FRAGMENTS = ["Mark", "twain", "42", "a", "OR", "AND", "or", "and", "ORAND", "ANDOR", "XOR", "ORE", " ", "  ", "-",
+             ",", ".", "\t", "'s", "(", ")"]
+UNICODE_FRAGMENTS = [unichr(0x212a), unichr(0x130), unichr(0xe9), u"\xc9cole"]
+
+
+def random_doc(rnd, unicode_doc=False):
+    fragments = FRAGMENTS + UNICODE_FRAGMENTS if unicode_doc else FRAGMENTS
+    doc = "".join(rnd.choice(fragments) for _ in range(rnd.randint(0, 12)))
+    return unicode(doc) if unicode_doc else doc
+
+
+class TokenizeTest(unittest.TestCase):
+
+    def check(self, doc):
+        expected = Document.preprocess(doc).lower().split()
+        self.assertEqual(Document.tokenize(doc), expected, repr(doc))
+        spans = Document.get_token_spans(doc)
+        self.assertEqual([doc[start:end].lower() for start, end in spans], expected, repr(doc))
+
+    def test_operators(self):
+        for doc in ["Mark OR Twain", "OR Mark", "Mark OR", " OR ", "a OR OR b", "a OR AND b", "a AND OR b",
+                    "a OR OR OR b", "(OR) a", "a -OR- b", "a or b", "Tom AND Jerry AND"]:
+            self.check(doc)
+
+    def test_unicode(self):
+        for doc in [unichr(0x212a) + u"elvin", unichr(0x130) + u"stanbul", unichr(0x212a) + u" OR " + unichr(0x130)]:
+            self.check(doc)
+
+    def test_random(self):
+        rnd = random.Random(0)
+        for i in range(20000):
+            self.check(random_doc(rnd, unicode_doc=i % 4 == 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+Tests of the entity selection of TAGME against the original implementation.
+
+Usage: python -m unittest discover tests
+"""
+import random
+import unittest
+
+import numpy
+
+from nordlys.el_tagme_sol import ELTagme
+
+
+def select_entity(score, commonness, k_th):
+    """Selects an entity as the original implementation did, from the {en: score} and {en: cmn} dictionaries."""
+    k = int(round(len(score.keys()) * k_th))
+    k = 1 if k == 0 else k
+    sorted_rel_scores = sorted(score.items(), key=lambda item: item[1], reverse=True)
+    top_k_ens = []
+    count = 1
+    prev_rel_score = sorted_rel_scores[0][1]
+    for en, rel_score in sorted_rel_scores:
+        if rel_score != prev_rel_score:
+            count += 1
+        if count > k:
+            break
+        top_k_ens.append(en)
+        prev_rel_score = rel_score
+    max_cmn = -1
+    max_en = None
+    for en in top_k_ens:
+        if commonness[en] > max_cmn:
+            max_en = en
+            max_cmn = commonness[en]
+    return max_en
+
+
+class SelectTopKTest(unittest.TestCase):
+
+    def setUp(self):
+        self.el = ELTagme.__new__(ELTagme)  # only the selection is tested, no statistics are needed
+        self.el.k_th = 0.3
+
+    def test_random(self):
+        rnd = random.Random(0)
+        entities = ["<wikipedia:Entity_%d>" % i for i in range(1000)]
+        for _ in range(5000):
+            n = rnd.choice([1, 2, 3, 5, 10, 50, ELTagme.NUMPY_SELECTION, 300])
+            ens = rnd.sample(entities, n)  # in the order of the commonness dictionary
+            commonness = {e: rnd.choice([0.1, 0.2, 0.5, rnd.random()]) for e in ens}
+            score = dict()
+            for e in ens:
+                score[e] = rnd.choice([0.0, 0.1, 0.5, 1.0, rnd.random()])
+            k_th = rnd.choice([0.0, 0.1, 0.3, 1.0])
+
+            # candidates are ordered by decreasing commonness
+            candidates = sorted(ens, key=lambda e: -commonness[e])
+            position = {e: i for i, e in enumerate(candidates)}
+            max_en = self.el.select_top_k(numpy.array([score[e] for e in candidates]),
+                                          numpy.array([commonness[e] for e in candidates]), k_th,
+                                          lambda: [position[e] for e in score])
+            self.assertEqual(candidates[max_en], select_entity(score, commonness, k_th))
+
+
+if __name__ == "__main__":
+    unittest.main()
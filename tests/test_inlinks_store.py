@@ -0,0 +1,72 @@
+"""
+Tests of the lookups of the inlinks store against the entity pairs statistics.
+
+Usage: python -m unittest discover tests
+"""
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from nordlys.entity_vocab import EntityVocab
+from nordlys.inlinks_store import InlinksStore
+
+
+class InlinksStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rnd = random.Random(0)
+        self.entities = ["<wikipedia:Entity_%d>" % i for i in range(200)]
+        with open(self.tmp_dir + "/mention_entity.tsv", "w") as f:
+            for i, e in enumerate(self.entities):
+                f.write("w%d\t%s\t1\n" % (i, e))
+        with open(self.tmp_dir + "/entity_inlinks.tsv", "w") as f:
+            for e in self.entities:
+                f.write("%s\t%d\n" % (e, rnd.randint(1, 100)))
+        # pairs are listed once, in either order
+        self.pairs = {}
+        with open(self.tmp_dir + "/entity_pairs_inlinks.tsv", "w") as f:
+            for _ in range(1000):
+                e1, e2 = rnd.sample(self.entities, 2)
+                if (e1, e2) not in self.pairs and (e2, e1) not in self.pairs:
+                    self.pairs[(e1, e2)] = rnd.randint(1, 10)
+                    f.write("%s\t%s\t%d\n" % (e1, e2, self.pairs[(e1, e2)]))
+        EntityVocab.build(self.tmp_dir + "/mention_entity.tsv", self.tmp_dir + "/entities")
+        self.vocab = EntityVocab(self.tmp_dir + "/entities")
+        InlinksStore.build(self.tmp_dir + "/entity_inlinks.tsv", self.tmp_dir + "/entity_pairs_inlinks.tsv",
+                           self.tmp_dir + "/inlinks", self.vocab)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def get_common(self, e1, e2):
+        return self.pairs.get((e1, e2), self.pairs.get((e2, e1), 0))
+
+    def check(self, store):
+        rnd = random.Random(1)
+        for _ in range(20):
+            ens1, ens2 = rnd.sample(self.entities, 30), rnd.sample(self.entities, 50)
+            ids1, ids2 = [store.get_entity_id(e) for e in ens1], [store.get_entity_id(e) for e in ens2]
+            expected = [[self.get_common(e1, e2) for e2 in ens2] for e1 in ens1]
+            self.assertEqual(store.common_inlinks_many(ids1, ids2).tolist(), expected)
+            self.assertEqual([[store.common_inlinks(i1, i2) for i2 in ids2] for i1 in ids1], expected)
+
+            # sparse list of the pairs of a single list of entities
+            rows, cols, common = store.common_inlinks_pairs(ids2)
+            dense = numpy.zeros((len(ids2), len(ids2)), dtype=numpy.int64)
+            dense[rows, cols] = common
+            self.assertTrue(numpy.all(rows <= cols))
+            self.assertEqual(numpy.triu(store.common_inlinks_many(ids2, ids2)).tolist(), dense.tolist())
+
+    def test_mmap(self):
+        self.check(InlinksStore(self.tmp_dir + "/inlinks", self.vocab))
+
+    def test_lazy(self):
+        self.check(InlinksStore(self.tmp_dir + "/inlinks", self.vocab, working_set_size=100))
+
+
+if __name__ == "__main__":
+    unittest.main()